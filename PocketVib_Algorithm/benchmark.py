@@ -0,0 +1,160 @@
+"""Throughput benchmarks for the PocketVib pipeline stages on the sample frames.
+
+Usage: python benchmark.py {decode,median,parallel} [--repeat N]
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'PocketVib_App', 'PocketVib_Analyzer', 'HelloWorld', 'app'))
+
+from helloworld.PocketVib_Vib import median_filter, vib_extraction  # noqa: E402
+from helloworld.PocketVib_Frames import load_frame  # noqa: E402
+
+SAMPLE_DATA = os.path.join(ROOT, 'sample_data')
+
+
+def sample_files():
+    return sorted(glob.glob(os.path.join(SAMPLE_DATA, 'frame_*.jpg')))
+
+
+def load_sample_frames():
+    return [np.array(Image.open(f).convert('L')) for f in sample_files()]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_median(frames, repeat):
+    # Band geometry of the sample capture: two row bands around one laser dot
+    bands = [frame[rows[0]:rows[1], 695:784] for frame in frames for rows in ((299, 627), (667, 973))]
+    pixels = sum(band.size for band in bands)
+
+    def pil():
+        return [np.array(Image.fromarray(band).filter(ImageFilter.MedianFilter(size=7))) for band in bands]
+
+    reference = pil()
+    for name, func in (('PIL MedianFilter', pil),
+                       ('median_filter exact', lambda: median_filter(bands)),
+                       ('median_filter separable', lambda: median_filter(bands, method='separable'))):
+        seconds = timed(func, repeat)
+        exact = all(np.array_equal(a, b) for a, b in zip(func(), reference))
+        print(f"{name:<26} {seconds * 1e3:8.2f} ms  {pixels / seconds / 1e6:8.2f} Mpx/s  matches PIL: {exact}")
+
+
+def bench_parallel(frames, repeat):
+    # Tile the sample capture so every worker gets several frames
+    frames = frames * 4
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, cores} | {n for n in (8, 16) if n <= cores})
+    reference = vib_extraction(frames)[0].data
+    serial = None
+    for workers in counts:
+        seconds = timed(lambda: vib_extraction(frames, workers=workers), repeat)
+        serial = serial or seconds
+        exact = np.array_equal(vib_extraction(frames, workers=workers)[0].data, reference)
+        print(f"workers={workers:<3} {seconds:7.2f} s  {len(frames) / seconds:7.1f} frames/s  "
+              f"speedup {serial / seconds:5.2f}x  matches serial: {exact}")
+    for threads in counts[1:]:
+        seconds = timed(lambda: vib_extraction(frames, threads=threads), repeat)
+        exact = np.array_equal(vib_extraction(frames, threads=threads)[0].data, reference)
+        print(f"threads={threads:<3} {seconds:7.2f} s  {len(frames) / seconds:7.1f} frames/s  "
+              f"speedup {serial / seconds:5.2f}x  matches serial: {exact}")
+
+
+def decode_convert(path):
+    return np.array(Image.open(path).convert('L'))
+
+
+def decode_luma(path):
+    return load_frame(path)
+
+
+def decode_red(path):
+    return load_frame(path, channel='red')
+
+
+def decode_luma_roi(path):
+    # Columns around the sample capture's laser dot
+    return load_frame(path, roi=(600, 900))
+
+
+def peak_rss_mb():
+    """This process's RSS high-water mark in MB."""
+    try:
+        with open('/proc/self/status') as status:
+            return next(int(line.split()[1]) for line in status if line.startswith('VmHWM')) / 2**10
+    except OSError:
+        # ru_maxrss is in kB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2**20 if sys.platform == 'darwin' else 2**10)
+
+
+def decode_in_fresh_process(decoder, files, repeat):
+    """(seconds per frame, peak RSS growth in MB) of decoder, measured in this process."""
+    decoder(files[0])
+    try:
+        # Linux: restart the high-water mark from the current RSS
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in files:
+            decoder(path)
+    seconds = (time.perf_counter() - start) / (repeat * len(files))
+    return seconds, peak_rss_mb() - before
+
+
+def bench_decode(frames, repeat):
+    files = sample_files()
+    reference = [decode_convert(path) for path in files]
+    # glibc: a fixed mmap threshold returns every frame-sized buffer to the OS on
+    # free, so one decoder's leftovers do not hide the next one's peak
+    os.environ.setdefault('MALLOC_MMAP_THRESHOLD_', str(2**17))
+    context = multiprocessing.get_context('spawn')
+    for name, decoder in (('open + convert(L)', decode_convert),
+                          ('load_frame luma', decode_luma),
+                          ('load_frame red', decode_red),
+                          ('load_frame luma ROI', decode_luma_roi)):
+        # A fresh interpreter per decoder so the RSS high-water mark is its own
+        with context.Pool(1) as pool:
+            seconds, peak_mb = pool.apply(decode_in_fresh_process, (decoder, files, repeat))
+        difference = max(int(np.max(np.abs(decoder(path).astype(int) - ref[:, 600:900] if 'ROI' in name
+                                             else decoder(path).astype(int) - ref)))
+                         for path, ref in zip(files, reference))
+        print(f"{name:<22} {seconds * 1e3:7.2f} ms/frame  peak +{peak_mb:6.1f} MB  "
+              f"max |diff| vs convert(L): {difference}")
+
+
+BENCHMARKS = {
+    'decode': bench_decode,
+    'median': bench_median,
+    'parallel': bench_parallel,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](load_sample_frames(), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import io
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+FRAME_CHANNELS = ('luma', 'red')
+
+
+def load_frame(source, channel='luma', roi=None):
+    """Decode one image (a path, bytes or a binary file object) straight to a 2-D uint8 frame.
+
+    'luma' asks a JPEG decoder for its Y plane through draft mode, so no RGB
+    image is built; other formats are converted after decoding. 'red' keeps the
+    red channel, for red lasers whose dot is faint in luma. roi=(left, right)
+    keeps only those columns, as FrameStack(roi=...) does, before the pixels are
+    copied into numpy.
+    """
+    if channel not in FRAME_CHANNELS:
+        raise ValueError(f"Unknown frame channel: {channel}")
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        if channel == 'luma':
+            # Only JPEG honours the request; the mode stays unchanged elsewhere
+            image.draft('L', image.size)
+            frame = image if image.mode == 'L' else image.convert('L')
+        elif image.mode in ('L', 'LA'):
+            # A grayscale image has no red channel of its own
+            frame = image.convert('L')
+        else:
+            frame = image.getchannel('R') if image.mode in ('RGB', 'RGBA') else image.convert('RGB').getchannel('R')
+        if roi is not None:
+            frame = frame.crop((roi[0], 0, roi[1], frame.height))
+        return np.array(frame, dtype=np.uint8)
+
+
+class FrameStack:
+    """Picked grayscale frames kept as one growable uint8 (n_frames, height, width) array.
+
+    Frames live in memory until the stack would exceed max_bytes; from then on
+    they are moved to a memory-mapped temporary file, so long captures are paged
+    by the OS instead of held in RAM. roi=(left, right) keeps only those columns
+    of every frame: rows are always kept whole because a row's index is its
+    readout time. Thumbnails are downsampled on first request and cached.
+
+    Indexing and iteration yield (height, width) views, so a stack can be passed
+    to vib_extraction like a list of frames.
+    """
+    def __init__(self, max_bytes=None, roi=None, thumbnail_height=100):
+        self.max_bytes = max_bytes
+        self.roi = roi
+        self.thumbnail_height = thumbnail_height
+        self._buffer = None
+        self._count = 0
+        self._file = None
+        self._thumbnails = {}
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("frame index out of range")
+        return self._buffer[index]
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self._buffer[index]
+
+    @property
+    def shape(self):
+        """Shape of one stored frame, None while the stack is empty."""
+        return None if self._buffer is None else self._buffer.shape[1:]
+
+    @property
+    def nbytes(self):
+        return 0 if self._buffer is None else self._count * self._buffer[0].nbytes
+
+    @property
+    def spilled(self):
+        """True once the frames have moved to the memory-mapped file."""
+        return self._file is not None
+
+    def append(self, frame):
+        """Store a 2-D grayscale frame (cropped to the ROI) and return its index."""
+        frame = np.asarray(frame)
+        if frame.ndim != 2:
+            raise ValueError("Frames must be 2-D grayscale images.")
+        if frame.dtype != np.uint8:
+            frame = np.clip(np.rint(frame), 0, 255).astype(np.uint8)
+        if self.roi is not None:
+            frame = frame[:, self.roi[0]:self.roi[1]]
+        if self._buffer is not None and frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the stack's {self.shape}.")
+        if self._buffer is None or self._count == len(self._buffer):
+            self._reserve(max(1, 2 * self._count), frame.shape)
+        self._buffer[self._count] = frame
+        self._count += 1
+        return self._count - 1
+
+    def _reserve(self, capacity, shape):
+        frame_bytes = int(np.prod(shape))
+        if self._file is None and (self.max_bytes is None or capacity * frame_bytes <= self.max_bytes):
+            buffer = np.empty((capacity,) + shape, dtype=np.uint8)
+        else:
+            if self._file is None:
+                self._file = tempfile.NamedTemporaryFile(prefix='pocketvib_frames_', suffix='.u8')
+            # Grow the file in place; frames already written there stay put
+            self._file.truncate(capacity * frame_bytes)
+            buffer = np.memmap(self._file.name, dtype=np.uint8, mode='r+', shape=(capacity,) + shape)
+        if self._buffer is not None and not (isinstance(self._buffer, np.memmap) and isinstance(buffer, np.memmap)):
+            buffer[:self._count] = self._buffer[:self._count]
+        self._buffer = buffer
+
+    def thumbnail(self, index, height=None):
+        """PIL thumbnail of a frame, height pixels tall (thumbnail_height by default)."""
+        height = height or self.thumbnail_height
+        key = (index, height)
+        if key not in self._thumbnails:
+            image = Image.fromarray(np.asarray(self[index]))
+            # Cheap integer box reduction first, then a small resize to the exact height
+            factor = max(1, image.height // height)
+            image = image.reduce(factor)
+            width = max(1, round(image.width * height / image.height))
+            self._thumbnails[key] = image.resize((width, height))
+        return self._thumbnails[key]
+
+    def thumbnail_png(self, index, height=None):
+        img_bytes = io.BytesIO()
+        self.thumbnail(index, height).save(img_bytes, format='PNG')
+        return img_bytes.getvalue()
+
+    def clear(self):
+        """Drop every frame and thumbnail and remove the spill file.
+
+        Views handed out earlier keep their data alive until they are released.
+        """
+        self._buffer = None
+        self._count = 0
+        self._thumbnails.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+
+class RawFrames:
+    """Y planes of a raw YUV capture as zero-copy (height, width) uint8 views of a memory map.
+
+    Built by open_nv12 or open_y4m. Indexing and iteration yield read-only views,
+    so vib_extraction can run on a raw capture without decoding or copying it.
+    """
+    def __init__(self, data, offsets, height, width, stride=None, fps=None):
+        self._data = data
+        self._offsets = list(offsets)
+        self.height = height
+        self.width = width
+        self.stride = stride or width
+        self.fps = fps
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        offset = self._offsets[index]
+        plane = self._data[offset:offset + self.stride * self.height]
+        return plane.reshape(self.height, self.stride)[:, :self.width]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def shape(self):
+        return (self.height, self.width)
+
+
+def open_nv12(path, width, height, stride=None, offset=0):
+    """RawFrames of a headerless NV12 dump (full-range 4:2:0 bi-planar, as the Collector records).
+
+    Each frame is a Y plane of height rows followed by an interleaved CbCr plane of
+    ceil(height / 2) rows, both stride bytes per row (width by default). offset
+    skips a file header.
+    """
+    stride = stride or width
+    if stride < width:
+        raise ValueError("The row stride cannot be smaller than the width.")
+    frame_bytes = stride * (height + (height + 1) // 2)
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    n_frames, remainder = divmod(len(data) - offset, frame_bytes)
+    if remainder:
+        raise ValueError(f"{path} does not hold a whole number of {width}x{height} NV12 frames.")
+    return RawFrames(data, range(offset, offset + n_frames * frame_bytes, frame_bytes), height, width, stride)
+
+
+# Bytes per frame beyond the Y plane for each 8-bit Y4M colour space
+_Y4M_CHROMA = {
+    '420': lambda w, h: 2 * ((w + 1) // 2) * ((h + 1) // 2),
+    '422': lambda w, h: 2 * ((w + 1) // 2) * h,
+    '444': lambda w, h: 2 * w * h,
+    'mono': lambda w, h: 0,
+}
+
+
+def open_y4m(path):
+    """RawFrames of a YUV4MPEG2 (.y4m) file with 8-bit 420, 422, 444 or mono frames."""
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    header_end = bytes(data[:512]).find(b'\n')
+    header = bytes(data[:max(header_end, 0)]).decode('ascii', 'replace').split()
+    if header_end <= 0 or not header or header[0] != 'YUV4MPEG2':
+        raise ValueError(f"{path} is not a YUV4MPEG2 file.")
+    params = {token[0]: token[1:] for token in header[1:]}
+    width, height = (int(params[key]) if params.get(key, '').isdigit() else 0 for key in 'WH')
+    if width == 0 or height == 0:
+        raise ValueError(f"{path} has a bad YUV4MPEG2 header: W and H must be positive integers.")
+    colour = params.get('C', '420')
+    family = 'mono' if colour == 'mono' else colour[:3]
+    # 420jpeg, 420paldv, ... are 8-bit; 420p10, 444p16, ... are not
+    if family not in _Y4M_CHROMA or (colour[3:4] == 'p' and colour[4:].isdigit()):
+        raise ValueError(f"Unsupported Y4M colour space: {colour}")
+    fps = None
+    if 'F' in params:
+        numerator, _, denominator = params['F'].partition(':')
+        if not (numerator.isdigit() and denominator.isdigit() and int(denominator)):
+            raise ValueError(f"{path} has a bad YUV4MPEG2 header: bad frame rate {params['F']}.")
+        fps = int(numerator) / int(denominator)
+
+    frame_bytes = width * height + _Y4M_CHROMA[family](width, height)
+    offsets = []
+    position = header_end + 1
+    while position < len(data):
+        # Every frame starts with its own FRAME[ params] line
+        line_end = bytes(data[position:position + 256]).find(b'\n')
+        if line_end < 0 or bytes(data[position:position + 5]) != b'FRAME':
+            raise ValueError(f"Bad frame header at byte {position} of {path}.")
+        start = position + line_end + 1
+        if start + frame_bytes > len(data):
+            raise ValueError(f"{path} ends inside a frame.")
+        offsets.append(start)
+        position = start + frame_bytes
+    return RawFrames(data, offsets, height, width, fps=fps)
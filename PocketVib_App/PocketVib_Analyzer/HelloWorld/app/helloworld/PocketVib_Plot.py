@@ -0,0 +1,210 @@
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from helloworld.PocketVib_Vib import band_spectrum, estimate_peak_frequency
+
+
+def envelope_polyline(values, x0, x_scale, y0, y_scale):
+    """Screen points of values plotted at (x0 + i * x_scale, y0 - values[i] * y_scale).
+
+    When several samples land in the same pixel column only that column's minimum
+    and maximum are kept, in the order they occur, so a single polyline of
+    O(width) points looks the same as drawing every sample.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return []
+    x = x0 + np.arange(len(values)) * x_scale
+    columns = np.floor(x)
+    starts = np.flatnonzero(np.r_[True, columns[1:] != columns[:-1]])
+    if len(starts) == len(values):
+        return list(zip(x.tolist(), (y0 - values * y_scale).tolist()))
+
+    lengths = np.diff(np.r_[starts, len(values)])
+    lows = np.minimum.reduceat(values, starts)
+    highs = np.maximum.reduceat(values, starts)
+    index = np.arange(len(values))
+    low_at = np.minimum.reduceat(np.where(values == np.repeat(lows, lengths), index, len(values)), starts)
+    high_at = np.minimum.reduceat(np.where(values == np.repeat(highs, lengths), index, len(values)), starts)
+    low_first = low_at <= high_at
+
+    ys = np.empty((len(starts), 2))
+    ys[:, 0] = np.where(low_first, lows, highs)
+    ys[:, 1] = np.where(low_first, highs, lows)
+    xs = np.repeat(columns[starts], 2)
+    return list(zip(xs.tolist(), (y0 - ys.ravel() * y_scale).tolist()))
+
+
+def to_png_bytes(image):
+    img_bytes = io.BytesIO()
+    image.save(img_bytes, format="PNG")
+    return img_bytes.getvalue()
+
+
+def render_displacement(signal, width=800, height=400, sample_period_ms=0.0114):
+    """Time-displacement graph of one speckle signal."""
+    signal = np.asarray(signal, dtype=np.float64)
+    graph = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(graph)
+
+    mid_y = height // 2  # Middle of the height for symmetric positive and negative displacement
+    draw.line((50, mid_y, width - 50, mid_y), fill="black", width=2)  # X-axis (time)
+    draw.line((50, 50, 50, height - 50), fill="black", width=2)  # Y-axis (displacement)
+
+    # X-axis label (Time)
+    draw.text((width // 2 - 20, mid_y + 20), "Time (ms)", fill="black", font_size=20)
+    # Y-axis label (Displacement)
+    draw.text((10, 10), "Displacement (pixel)", fill="black", font_size=20)
+
+    # Add ticks and labels for X-axis (in milliseconds)
+    num_ticks_x = 5
+    total_time_ms = len(signal) * sample_period_ms  # Total time in milliseconds
+    for i in range(num_ticks_x + 1):
+        x = 50 + i * (width - 100) // num_ticks_x
+        draw.line((x, mid_y - 5, x, mid_y + 5), fill="black", width=2)  # Tick
+        time_ms = i * total_time_ms / num_ticks_x
+        draw.text((x - 10, mid_y + 10), f"{time_ms:.2f}", fill="black", font_size=18)  # Label
+
+    # Add ticks and labels for Y-axis (symmetric positive and negative)
+    num_ticks_y = 5
+    max_displacement = np.max(np.abs(signal)) if len(signal) else 0.0  # Maximum absolute displacement
+    for i in range(-num_ticks_y, num_ticks_y + 1):
+        y = mid_y - i * (height - 100) // (2 * num_ticks_y)
+        draw.line((45, y, 55, y), fill="black", width=2)  # Tick
+        value = max_displacement * i / num_ticks_y
+        draw.text((0, y - 10), f"{value:.2f}", fill="black", font_size=18)  # Label
+
+    # Normalize data
+    x_scale = (width - 100) / max(len(signal), 1)
+    y_scale = (height - 100) / (2 * max_displacement) if max_displacement > 0 else 1
+
+    # Plot the speckle data, centred on mid_y
+    draw.line(envelope_polyline(signal, 50, x_scale, mid_y, y_scale), fill="blue", width=2)
+    return graph
+
+
+def render_spectrum(freqs, amplitudes, measured_freq, freq_range=(40, 2000), width=800, height=400):
+    """Amplitude spectrum graph with the peak bin circled and labelled with measured_freq."""
+    amplitudes = np.asarray(amplitudes, dtype=np.float64)
+    graph = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(graph)
+
+    # Define margins for the graph
+    left_margin = 50
+    right_margin = 50
+    top_margin = 30
+    bottom_margin = 50
+
+    # Draw axes
+    draw.line((left_margin, height - bottom_margin, width - right_margin, height - bottom_margin), fill="black", width=2)  # X-axis (Frequency)
+    draw.line((left_margin, top_margin, left_margin, height - bottom_margin), fill="black", width=2)  # Y-axis (Amplitude)
+
+    # X-axis label (Frequency)
+    draw.text((width // 2 - 40, height - bottom_margin + 30), "Frequency (Hz)", fill="black", font_size=20)
+    # Y-axis label (Amplitude)
+    draw.text((left_margin - 40, top_margin - 30), "Amplitude", fill="black", font_size=20)
+
+    min_freq, max_freq = freq_range
+    max_amplitude = np.max(amplitudes)
+    peak_index = np.argmax(amplitudes)  # Index of the peak value
+    peak_amplitude = amplitudes[peak_index]  # Amplitude of the peak
+
+    # Calculate scaling factors
+    x_scale = (width - left_margin - right_margin) / len(freqs)
+    y_scale = (height - top_margin - bottom_margin) / (max_amplitude * 1.1) if max_amplitude > 0 else 1  # Add 10% padding to Y-axis
+
+    # Add ticks and labels for X-axis
+    num_ticks_x = 5
+    for i in range(num_ticks_x + 1):
+        x = left_margin + i * (width - left_margin - right_margin) // num_ticks_x
+        draw.line((x, height - bottom_margin, x, height - bottom_margin + 5), fill="black", width=2)  # Tick
+        freq_value = min_freq + i * (max_freq - min_freq) / num_ticks_x
+        draw.text((x - 20, height - bottom_margin + 10), f"{freq_value:.0f}", fill="black", font_size=18)  # Label
+
+    # Add ticks and labels for Y-axis
+    num_ticks_y = 5
+    for i in range(num_ticks_y + 1):
+        y = height - bottom_margin - i * (height - top_margin - bottom_margin) // num_ticks_y
+        draw.line((left_margin - 5, y, left_margin, y), fill="black", width=2)  # Tick
+        value = max_amplitude * i / num_ticks_y
+        draw.text((left_margin - 50, y - 10), f"{value:.2f}", fill="black", font_size=18)  # Label
+
+    # Plot the frequency spectrum
+    draw.line(envelope_polyline(amplitudes, left_margin, x_scale, height - bottom_margin, y_scale), fill="red", width=2)
+
+    # Add a circle to highlight the peak point
+    peak_x = left_margin + peak_index * x_scale
+    peak_y = height - bottom_margin - peak_amplitude * y_scale
+    draw.ellipse(
+        [
+            (peak_x - 10, peak_y - 10),  # Top-left corner
+            (peak_x + 10, peak_y + 10)   # Bottom-right corner
+        ],
+        outline="red",  # Circle border color
+        width=4,        # Circle border thickness
+        fill="yellow"   # Fill color of the circle
+    )
+
+    # Draw a vertical line from the peak to the X-axis
+    draw.line((peak_x, peak_y, peak_x, height - bottom_margin), fill="blue", width=2)
+
+    # Display measured frequency as text near the circle
+    draw.text((peak_x - 50, peak_y - 40), f"{measured_freq:.2f} Hz", fill="black", font_size=20)
+    return graph
+
+
+def render_speckle(signal, sample_period, freq_range=(40, 2000), size=(800, 400)):
+    """Both detail-screen graphs of one speckle as (displacement PNG, spectrum PNG, measured frequency).
+
+    sample_period is the spacing of the signal's samples, i.e. the DisplacementStore's.
+    """
+    width, height = size
+    fs = 1 / sample_period
+    # Unpadded spectrum over the plotted band; the main frequency comes from peak interpolation instead of padding
+    freqs, amplitudes = band_spectrum(signal, fs, freq_range, pad=1)
+    measured_freq = estimate_peak_frequency(signal, fs, freq_range)
+    return (to_png_bytes(render_displacement(signal, width, height, sample_period_ms=1e3 / fs)),
+            to_png_bytes(render_spectrum(freqs, amplitudes, measured_freq, freq_range, width, height)),
+            measured_freq)
+
+
+class RenderCache:
+    """Bounded LRU of rendered results, e.g. render_speckle keyed by (analysis id, speckle, size).
+
+    Safe to fill from a background thread while the UI reads it; two threads
+    asking for the same missing key may both compute it.
+    """
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, compute):
+        """Cached value of key, calling compute() to fill it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
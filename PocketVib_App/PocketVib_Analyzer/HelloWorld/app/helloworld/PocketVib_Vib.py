@@ -1,103 +1,284 @@
+import functools
 import numpy as np
-from PIL import Image, ImageFilter
 import time
 
+LINE_TIME = 11.4e-6
+FRAME_RATE = 30
+# Shortest row band detect_rois keeps: the notebook's "end - start > 100" on an inclusive end, i.e. 100 + 2 rows
+MIN_BAND_ROWS = 102
+
+def run_lengths(mask, min_length=1):
+    """(start, end, length) arrays of the True runs in a boolean mask, end inclusive.
+
+    A 2-D mask is encoded row by row and a leading array of row indices is returned.
+    Only runs of at least min_length samples are kept.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    batched = mask.ndim == 2
+    mask = np.atleast_2d(mask)
+    edges = np.diff(np.pad(mask.view(np.int8), ((0, 0), (1, 1))), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1] - 1
+    lengths = ends - starts + 1
+
+    keep = lengths >= min_length
+    rows, starts, ends, lengths = rows[keep], starts[keep], ends[keep], lengths[keep]
+    return (rows, starts, ends, lengths) if batched else (starts, ends, lengths)
+
+
+def longest_runs(starts, ends, lengths, count=2):
+    """The count longest runs (earlier start wins ties), returned in start order."""
+    keep = np.sort(np.lexsort((starts, -lengths))[:count])
+    return starts[keep], ends[keep], lengths[keep]
+
+
 def find_intervals(mask, flag):
-    if flag == 0:
-        min = 60
-    else:
-        min = 100
-    intervals = []
-    start = None
-    for i, value in enumerate(mask):
-        if value and start is None:
-            start = i
-        elif not value and start is not None:
-            if (i - 1) - start > min:
-                intervals.append((start, i - 1))
-            start = None
-            
-    if start is not None:
-        if (len(mask) - 1) - start > min:
-            intervals.append((start, len(mask) - 1))
-    
-    return intervals
+    """Inclusive (start, end) True runs longer than 60 (flag 0) or 100 samples, as the notebook keeps them."""
+    shortest = 60 if flag == 0 else 100
+    # "end - start > shortest" on an inclusive end: one sample for the end, one for the strict inequality
+    starts, ends, _ = run_lengths(mask, min_length=shortest + 2)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def fast_fft_length(n):
+    """Smallest 5-smooth length >= n, which pocketfft transforms efficiently."""
+    best = 1 << max(n - 1, 0).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            length = p35
+            while length < n:
+                length *= 2
+            best = min(best, length)
+            p35 *= 3
+        p5 *= 5
+    return best
 
 
-def find_shift_subpixel(image):
-    dis = [0]
+def normalize_rows(image):
+    image = np.asarray(image, dtype=np.float64)
     means = np.mean(image, axis=1, keepdims=True)
     stds = np.std(image, axis=1, keepdims=True)
-    image = (image - means) / (stds+1e-6)
-   
-    for row in range(image.shape[0] - 1):
-        current = image[row]
-        next_row = image[row+1]
-        correlation = np.correlate(current, next_row, mode='full')
-        max_index = np.argmax(correlation)
-        shift = max_index - (len(current) - 1)
-        
-        
-        if 1 <= max_index <= len(correlation) - 2:
-            R_m1 = correlation[max_index - 1]
-            R_0 = correlation[max_index]
-            R_p1 = correlation[max_index + 1]
-            
-            denominator = R_m1 - 2 * R_0 + R_p1
-            if denominator != 0:
-                subpixel_offset = 0.5 * (R_m1 - R_p1) / denominator
-                shift += subpixel_offset
-        
-        dis.append(shift)
-    
-    return np.array(dis)
+    return (image - means) / (stds+1e-6)
 
-def detect_peaks_with_width(signal, height_threshold, min_distance):
-    signal = np.array(signal)
-    
-    baseline = np.median(signal)
-    signal_range = np.max(signal) - baseline
+
+def row_cross_correlation(image):
+    """Full cross-correlation of every adjacent row pair, computed as one 2-D FFT batch."""
+    height, width = image.shape
+    n_fft = fast_fft_length(2 * width - 1)
+    spectra = np.fft.rfft(image, n_fft, axis=1)
+    correlation = np.fft.irfft(spectra[:-1] * np.conj(spectra[1:]), n_fft, axis=1)
+    # Reorder circular lags into np.correlate's 'full' layout: -(W-1) ... W-1
+    return np.concatenate((correlation[:, n_fft - (width - 1):], correlation[:, :width]), axis=1)
+
+
+def subpixel_peak(correlation):
+    """Argmax of each correlation row refined by a three-point parabolic fit."""
+    max_index = np.argmax(correlation, axis=1)
+    rows = np.arange(correlation.shape[0])
+    peak = max_index.astype(np.float64)
+
+    inner = (max_index >= 1) & (max_index <= correlation.shape[1] - 2)
+    R_m1 = correlation[rows[inner], max_index[inner] - 1]
+    R_0 = correlation[rows[inner], max_index[inner]]
+    R_p1 = correlation[rows[inner], max_index[inner] + 1]
+
+    denominator = R_m1 - 2 * R_0 + R_p1
+    nonzero = denominator != 0
+    offset = np.zeros_like(denominator)
+    offset[nonzero] = 0.5 * (R_m1[nonzero] - R_p1[nonzero]) / denominator[nonzero]
+    peak[inner] += offset
+    return peak
+
+
+def bounded_row_cross_correlation(image, max_shift):
+    """Correlation of every adjacent row pair evaluated only at lags -max_shift..max_shift."""
+    height, width = image.shape
+    current = image[:-1]
+    following = image[1:]
+    correlation = np.empty((height - 1, 2 * max_shift + 1))
+    for k, lag in enumerate(range(-max_shift, max_shift + 1)):
+        if lag >= 0:
+            correlation[:, k] = np.einsum('ij,ij->i', current[:, lag:], following[:, :width - lag])
+        else:
+            correlation[:, k] = np.einsum('ij,ij->i', current[:, :width + lag], following[:, -lag:])
+    return correlation
+
+
+def find_shift_subpixel(image, max_shift=None, return_clipped=False, min_correlation=0.5):
+    """Sub-pixel shift between each row and the next.
+
+    With max_shift set, only lags within +-max_shift are evaluated. A row pair is
+    flagged as clipped when its peak lands on the window edge or its normalized
+    correlation falls below min_correlation (the true peak is likely outside the
+    window); flagged pairs are re-estimated with the full correlation, so the
+    result never saturates at the window limit.
+    """
+    image = normalize_rows(image)
+    height, width = image.shape
+    dis = np.zeros(height)
+    clipped = np.zeros(height, dtype=bool)
+    if height < 2:
+        return (dis, clipped) if return_clipped else dis
+
+    if max_shift is None or max_shift >= width - 1:
+        correlation = row_cross_correlation(image)
+        dis[1:] = subpixel_peak(correlation) - (width - 1)
+    else:
+        correlation = bounded_row_cross_correlation(image, max_shift)
+        max_index = np.argmax(correlation, axis=1)
+        overlap = width - np.abs(max_index - max_shift)
+        coefficient = correlation[np.arange(height - 1), max_index] / overlap
+        clipped[1:] = (max_index == 0) | (max_index == 2 * max_shift) | (coefficient < min_correlation)
+        dis[1:] = subpixel_peak(correlation) - max_shift
+
+        rows = np.nonzero(clipped[1:])[0]
+        if len(rows) > 0:
+            # Interleave each flagged pair so adjacent-row correlation yields them on even rows
+            pairs = np.stack((image[rows], image[rows + 1]), axis=1).reshape(-1, width)
+            correlation = row_cross_correlation(pairs)[::2]
+            dis[rows + 1] = subpixel_peak(correlation) - (width - 1)
+
+    return (dis, clipped) if return_clipped else dis
+
+def _greedy_suppression(rows, peaks, min_distance):
+    keep = np.zeros(len(peaks), dtype=bool)
+    last_row, last_peak = -1, 0
+    for n, (row, peak) in enumerate(zip(rows, peaks)):
+        if row != last_row or peak - last_peak >= min_distance:
+            keep[n] = True
+            last_row, last_peak = row, peak
+    return keep
+
+
+def _priority_suppression(rows, peaks, heights, min_distance):
+    # scipy.signal.find_peaks(distance=...): drop neighbours of higher peaks first
+    keep = np.ones(len(peaks), dtype=bool)
+    distance = np.ceil(min_distance)
+    for row in np.unique(rows):
+        members = np.nonzero(rows == row)[0]
+        positions = peaks[members]
+        alive = np.ones(len(members), dtype=bool)
+        for j in np.argsort(heights[members])[::-1]:
+            if alive[j]:
+                close = np.abs(positions - positions[j]) < distance
+                close[j] = False
+                alive &= ~close
+        keep[members] = alive
+    return keep
+
+
+def _local_maxima(signal):
+    # Plateau-aware maxima (midpoint of flat tops) as in scipy.signal.find_peaks
+    n_rows, length = signal.shape
+    flat = signal.ravel()
+    new_run = np.ones(flat.size, dtype=bool)
+    new_run[1:] = flat[1:] != flat[:-1]
+    new_run[::length] = True
+    starts = np.nonzero(new_run)[0]
+    ends = np.append(starts[1:], flat.size) - 1
+    values = flat[starts]
+    run_rows = starts // length
+    inner = np.zeros(len(starts), dtype=bool)
+    inner[1:-1] = ((run_rows[1:-1] == run_rows[:-2]) & (run_rows[1:-1] == run_rows[2:])
+                   & (values[1:-1] > values[:-2]) & (values[1:-1] > values[2:]))
+    midpoints = (starts[inner] + ends[inner]) // 2
+    return midpoints // length, midpoints % length
+
+
+def _prominence_widths(signal, rows, peaks, rel_height=0.5):
+    # scipy.signal.peak_prominences followed by peak_widths, evaluated for all peaks at once
+    x = signal[rows]
+    index = np.arange(signal.shape[1])
+    peak_height = x[np.arange(len(peaks)), peaks][:, None]
+    higher = x > peak_height
+    left_stop = np.max(np.where(higher & (index < peaks[:, None]), index, -1), axis=1)
+    right_stop = np.min(np.where(higher & (index > peaks[:, None]), index, signal.shape[1]), axis=1)
+
+    left_seg = np.where((index > left_stop[:, None]) & (index <= peaks[:, None]), x, np.inf)
+    right_seg = np.where((index >= peaks[:, None]) & (index < right_stop[:, None]), x, np.inf)
+    left_base = signal.shape[1] - 1 - np.argmin(left_seg[:, ::-1], axis=1)
+    right_base = np.argmin(right_seg, axis=1)
+    prominence = peak_height[:, 0] - np.maximum(left_seg.min(axis=1), right_seg.min(axis=1))
+
+    height = (peak_height[:, 0] - prominence * rel_height)[:, None]
+    below = x <= height
+    span = np.arange(len(peaks))
+    left_cand = below & (index > left_base[:, None]) & (index <= peaks[:, None])
+    left = np.where(left_cand.any(axis=1), signal.shape[1] - 1 - np.argmax(left_cand[:, ::-1], axis=1), left_base)
+    right_cand = below & (index >= peaks[:, None]) & (index < right_base[:, None])
+    right = np.where(right_cand.any(axis=1), np.argmax(right_cand, axis=1), right_base)
+
+    height = height[:, 0]
+    left_ip = left.astype(np.float64)
+    x_left = x[span, left]
+    step = x_left < height
+    left_ip[step] += (height[step] - x_left[step]) / (x[span[step], left[step] + 1] - x_left[step])
+    right_ip = right.astype(np.float64)
+    x_right = x[span, right]
+    step = x_right < height
+    right_ip[step] -= (height[step] - x_right[step]) / (x[span[step], right[step] - 1] - x_right[step])
+    return left_ip, right_ip
+
+
+def detect_peaks_with_width(signal, height_threshold, min_distance, method='greedy', min_width=50):
+    """(start, end) intervals of the peaks in one projection, or in each row of a 2-D batch.
+
+    'greedy' keeps local maxima left to right at least min_distance apart and walks
+    out to half height above the median baseline. 'prominence' reproduces
+    scipy.signal.find_peaks + peak_widths(rel_height=0.5) as used by the notebook,
+    dropping intervals narrower than min_width.
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    batched = signal.ndim == 2
+    signal = np.atleast_2d(signal)
+    n_rows, length = signal.shape
+
+    baseline = np.median(signal, axis=1)
+    signal_range = np.max(signal, axis=1) - baseline
     threshold = baseline + height_threshold * signal_range
 
-    peaks = []
-    for i in range(1, len(signal) - 1):
-        if signal[i] > signal[i - 1] and signal[i] > signal[i + 1] and signal[i] >= threshold:
-            peaks.append(i)
-
-    if len(peaks) > 1:
-        filtered_peaks = [peaks[0]]
-        for p in peaks[1:]:
-            if p - filtered_peaks[-1] >= min_distance:
-                filtered_peaks.append(p)
-        peaks = filtered_peaks
-
-    intervals = []
-    for i, peak in enumerate(peaks):
-        left = peak
-        right = peak
-        peak_height = signal[peak]
-        half_height = baseline + (peak_height - baseline) / 2
-
-        left_limit = 0
-        right_limit = len(signal) - 1
-        if i > 0:
-            left_limit = (peaks[i - 1] + peak) // 2
-        if i < len(peaks) - 1:
-            right_limit = (peak + peaks[i + 1]) // 2
-
-        while left > left_limit:
-            if signal[left - 1] <= half_height:
-                break
-            left -= 1
-
-        while right < right_limit:
-            if signal[right + 1] <= half_height:
-                break
-            right += 1
-
-        intervals.append((left, right))
-
-    return intervals
+    if method == 'greedy':
+        centre = signal[:, 1:-1]
+        local_max = (centre > signal[:, :-2]) & (centre > signal[:, 2:]) & (centre >= threshold[:, None])
+        rows, peaks = np.nonzero(local_max)
+        peaks = peaks + 1
+        keep = _greedy_suppression(rows, peaks, min_distance)
+        rows, peaks = rows[keep], peaks[keep]
+
+        same_prev = np.zeros(len(peaks), dtype=bool)
+        same_prev[1:] = rows[1:] == rows[:-1]
+        same_next = np.zeros(len(peaks), dtype=bool)
+        same_next[:-1] = same_prev[1:]
+        left_limit = np.where(same_prev, (np.roll(peaks, 1) + peaks) // 2, 0)
+        right_limit = np.where(same_next, (peaks + np.roll(peaks, -1)) // 2, length - 1)
+
+        half_height = baseline[rows] + (signal[rows, peaks] - baseline[rows]) / 2
+        below = signal[rows] <= half_height[:, None]
+        index = np.arange(length)
+        left_cand = below & (index >= left_limit[:, None]) & (index < peaks[:, None])
+        right_cand = below & (index > peaks[:, None]) & (index <= right_limit[:, None])
+        starts = np.where(left_cand.any(axis=1), length - np.argmax(left_cand[:, ::-1], axis=1), left_limit)
+        ends = np.where(right_cand.any(axis=1), np.argmax(right_cand, axis=1) - 1, right_limit)
+    elif method == 'prominence':
+        rows, peaks = _local_maxima(signal)
+        heights = signal[rows, peaks]
+        keep = heights >= threshold[rows]
+        rows, peaks, heights = rows[keep], peaks[keep], heights[keep]
+        keep = _priority_suppression(rows, peaks, heights, min_distance)
+        rows, peaks = rows[keep], peaks[keep]
+        left_ip, right_ip = _prominence_widths(signal, rows, peaks)
+        starts, ends = left_ip.astype(int), right_ip.astype(int)
+        keep = ends - starts >= min_width
+        rows, starts, ends = rows[keep], starts[keep], ends[keep]
+    else:
+        raise ValueError(f"Unknown peak detection method: {method}")
+
+    intervals = [[] for _ in range(n_rows)]
+    for row, start, end in zip(rows.tolist(), starts.tolist(), ends.tolist()):
+        intervals[row].append((start, end))
+    return intervals if batched else intervals[0]
 
 def gaussian_kernel(sigma, kernel_size=None):
 
@@ -115,9 +296,10 @@ def gaussian_kernel(sigma, kernel_size=None):
     
     return kernel
 
-def gaussian_filter1d(arr, sigma=1):
+def gaussian_filter1d(arr, sigma=1, kernel=None):
 
-    kernel = gaussian_kernel(sigma)
+    if kernel is None:
+        kernel = gaussian_kernel(sigma)
     
     pad_width = len(kernel) // 2
     
@@ -127,28 +309,202 @@ def gaussian_filter1d(arr, sigma=1):
     
     return filtered
 
-def lowpass_filter(signal, cutoff_freq, fs, order=3):
-
-    N = len(signal)
-    
-    signal_fft = np.fft.rfft(signal)
-    
+@functools.lru_cache(maxsize=64)
+def butterworth_response(N, cutoff_freq, fs, order=3):
+    """Butterworth magnitude response on the rfft grid of an N-sample signal (read-only, cached)."""
     freqs = np.fft.rfftfreq(N, d=1/fs)
-    
+
     norm_cutoff = cutoff_freq / (fs/2)
 
     h = 1.0 / (1.0 + (freqs/(norm_cutoff*fs/2))**(2*order))
-    
-    filtered_fft = signal_fft * h
-    
-    filtered_signal = np.fft.irfft(filtered_fft, n=N)
-    
+    h.flags.writeable = False
+
+    return h
+
+def lowpass_filter(signal, cutoff_freq, fs, order=3, lengths=None):
+    """Zero-phase Butterworth magnitude low-pass in the frequency domain.
+
+    A 2-D signal filters every row on its own. lengths gives the valid prefix of
+    each row (the rest is padding and comes back as zeros); rows that share a
+    length go through one rfft/irfft pair, so every row matches a 1-D call.
+    """
+    signal = np.asarray(signal)
+    if signal.ndim == 1:
+        N = len(signal)
+        filtered_fft = np.fft.rfft(signal) * butterworth_response(N, cutoff_freq, fs, order)
+        return np.fft.irfft(filtered_fft, n=N)
+
+    if lengths is None:
+        lengths = np.full(len(signal), signal.shape[1])
+    lengths = np.asarray(lengths)
+    filtered_signal = np.zeros(signal.shape)
+    for N in np.unique(lengths):
+        rows = np.nonzero(lengths == N)[0]
+        if N == 0:
+            continue
+        filtered_fft = np.fft.rfft(signal[rows, :N], axis=1) * butterworth_response(int(N), cutoff_freq, fs, order)
+        filtered_signal[rows, :N] = np.fft.irfft(filtered_fft, n=N, axis=1)
     return filtered_signal
 
-def adaptive_ar_interpolation(signal, single_point_segment_index, ar_order=None, max_iterations=3):
+def butter_sos(order, cutoff_freq, fs):
+    """Digital Butterworth low-pass as rows (b0, b1, b2, 1, a1, a2) of second-order sections.
+
+    Bilinear transform with a prewarped cutoff, laid out like scipy's
+    butter(output='sos'): an odd order's real pole comes first, the pole pairs
+    closest to the unit circle last, the odd zero at -1 sits in the last section
+    and the overall gain in the first (unity at DC).
+    """
+    warped = 2 * fs * np.tan(np.pi * cutoff_freq / fs)
+    sections = []
+    if order % 2:
+        pole = (2 * fs - warped) / (2 * fs + warped)
+        sections.append([1, 2, 1, 1, -pole, 0])
+    for k in range(order // 2, 0, -1):
+        analog = warped * np.exp(1j * np.pi * (2 * k + order - 1) / (2 * order))
+        pole = (2 * fs + analog) / (2 * fs - analog)
+        sections.append([1, 2, 1, 1, -2 * pole.real, abs(pole)**2])
+    sos = np.array(sections, dtype=np.float64)
+    if order % 2:
+        sos[-1, :3] = [1, 1, 0]
+    sos[0, :3] /= np.prod(sos[:, :3].sum(axis=1) / sos[:, 3:].sum(axis=1))
+    return sos
+
+def sosfilt_zi(sos):
+    """Per-section state (n_sections, 2) of the steady-state response to a unit step."""
+    zi = np.zeros((len(sos), 2))
+    scale = 1.0
+    for section, (b0, b1, b2, _, a1, a2) in enumerate(sos):
+        # Direct form II transposed: solve (I - A^T) zi = b[1:] - a[1:] * b0
+        IminusA = np.array([[1 + a1, -1.0], [a2, 1.0]])
+        zi[section] = scale * np.linalg.solve(IminusA, [b1 - a1 * b0, b2 - a2 * b0])
+        scale *= (b0 + b1 + b2) / (1 + a1 + a2)
+    return zi
+
+def sosfilt(sos, x, zi=None):
+    """Causal second-order-sections filter along the last axis of x.
+
+    Returns (y, zf). zf has shape (n_sections, *x.shape[:-1], 2) and, passed back
+    as zi with the next block, continues the filter exactly where it stopped, so a
+    signal can be filtered in pieces (bands, frames, a live feed) with the same
+    output as in one go. Every leading row (e.g. each speckle) is filtered at once.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if zi is None:
+        state = np.zeros((len(sos),) + x.shape[:-1] + (2,))
+    else:
+        state = np.array(zi, dtype=np.float64)
+    # Time-major copy so each step reads one contiguous slice across rows
+    y = np.ascontiguousarray(np.moveaxis(x, -1, 0))
+    for section, (b0, b1, b2, _, a1, a2) in enumerate(sos):
+        z0, z1 = state[section, ..., 0].copy(), state[section, ..., 1].copy()
+        for n in range(len(y)):
+            xn = y[n].copy()
+            y[n] = b0 * xn + z0
+            z0 = b1 * xn - a1 * y[n] + z1
+            z1 = b2 * xn - a2 * y[n]
+        state[section, ..., 0], state[section, ..., 1] = z0, z1
+    return np.moveaxis(y, 0, -1), state
+
+def sosfiltfilt(sos, x, padlen=None):
+    """Zero-phase forward-backward filtering along the last axis, matching scipy's sosfiltfilt.
+
+    The ends are extended by odd reflection of padlen samples (by default
+    3 * (2 * n_sections + 1 - trivial sections), 3 * (order + 1) for
+    butter_sos) and each pass starts from the steady state of its first sample.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if padlen is None:
+        padlen = 3 * (2 * len(sos) + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum()))
+    if x.shape[-1] <= padlen:
+        raise ValueError(f"The signal must be longer than padlen ({padlen}) samples.")
+    if padlen > 0:
+        x = np.concatenate((2 * x[..., :1] - x[..., padlen:0:-1], x,
+                            2 * x[..., -1:] - x[..., -2:-padlen - 2:-1]), axis=-1)
+    zi = sosfilt_zi(sos).reshape((len(sos),) + (1,) * (x.ndim - 1) + (2,))
+    y, _ = sosfilt(sos, x, zi * x[..., :1])
+    y, _ = sosfilt(sos, y[..., ::-1], zi * y[..., -1:])
+    y = y[..., ::-1]
+    return y[..., padlen:y.shape[-1] - padlen]
+
+def _lstsq_ar(x, order):
+    # Row i holds the order samples before x[i + order], newest first
+    X = np.lib.stride_tricks.sliding_window_view(x[:-1], order)[:, ::-1]
+    y = x[order:]
+    try:
+        return np.linalg.lstsq(X, y, rcond=None)[0]
+    except np.linalg.LinAlgError:
+        XTX = X.T @ X
+        reg = 0.01 * np.eye(XTX.shape[0])
+        return np.linalg.inv(XTX + reg) @ X.T @ y
+
+def _burg_ar(x, order):
+    f = np.array(x, dtype=np.float64)
+    b = f.copy()
+    a = np.ones(1)
+    for m in range(order):
+        ff, bb = f[m + 1:], b[m:-1]
+        denominator = np.dot(ff, ff) + np.dot(bb, bb)
+        k = -2 * np.dot(bb, ff) / denominator if denominator > 0 else 0.0
+        f[m + 1:], b[m + 1:] = ff + k * bb, bb + k * ff
+        a = np.r_[a, 0.0]
+        a = a + k * a[::-1]
+    return -a[1:]
+
+def _yule_walker_ar(x, order):
+    n = len(x)
+    n_fft = fast_fft_length(2 * n)
+    spectrum = np.fft.rfft(x, n_fft)
+    # irfft needs n_fft back explicitly: fast lengths can be odd
+    r = np.fft.irfft(np.abs(spectrum)**2, n_fft)[:order + 1] / n
+    a = np.zeros(order)
+    error = r[0]
+    for m in range(order):
+        if error <= 0:
+            break
+        # Levinson-Durbin step
+        k = (r[m + 1] - np.dot(a[:m], r[m:0:-1])) / error
+        a[:m] = a[:m] - k * a[:m][::-1]
+        a[m] = k
+        error *= 1 - k * k
+    return a
+
+AR_METHODS = {
+    'lstsq': _lstsq_ar,
+    'burg': _burg_ar,
+    'yule_walker': _yule_walker_ar,
+}
+
+def ar_coefficients(x, order, method='lstsq'):
+    """AR(order) coefficients a with x[n] ~ sum_i a[i] * x[n - 1 - i].
 
+    'lstsq' is the covariance-method least-squares fit; 'burg' (O(n*order)) and
+    'yule_walker' (Levinson-Durbin on the biased autocorrelation) give stable,
+    cheaper estimates of the same model.
+    """
+    if method not in AR_METHODS:
+        raise ValueError(f"Unknown AR method: {method}")
+    if len(x) <= order:
+        raise ValueError("Not enough known samples to estimate AR parameters.")
+    return AR_METHODS[method](np.asarray(x, dtype=np.float64), order)
+
+def _ar_predict(signal_filled, missing_indices, ar_params):
+    """Fill missing_indices in place, in order, each from the ar_order samples before it."""
+    ar_order = len(ar_params)
+    padded = np.concatenate((np.zeros(ar_order), signal_filled))
+    for idx in missing_indices:
+        # Samples before the window count as zeros
+        signal_filled[idx] = padded[idx + ar_order] = np.dot(ar_params, padded[idx:idx + ar_order][::-1])
+
+def adaptive_ar_interpolation(signal, single_point_segment_index, ar_order=None, max_iterations=3,
+                              method='lstsq', forward_backward=False):
+    """Fill the zero gap between two row bands with an AR model of the known samples.
+
+    The model comes from ar_coefficients(method); forward_backward also predicts
+    the gap backwards from the later band and cross-fades the two predictions
+    linearly across each gap.
+    """
     dis = np.zeros_like(signal)
-    
+
     signal = signal[single_point_segment_index[0][0]:single_point_segment_index[1][1]]
     missing_indices = np.where(signal == 0)[0]
 
@@ -160,103 +516,910 @@ def adaptive_ar_interpolation(signal, single_point_segment_index, ar_order=None,
     signal_filled[missing_indices] = 0.0
 
     for iteration in range(max_iterations):
-        known_indices = np.where(signal_filled != 0)[0]
-        known_signal = signal_filled[known_indices]
-        
-        if len(known_signal) <= ar_order:
-            raise ValueError("Not enough known samples to estimate AR parameters.")
-
-        X = np.zeros((len(known_signal) - ar_order, ar_order))
-        y = np.zeros(len(known_signal) - ar_order)
-        
-        for i in range(ar_order, len(known_signal)):
-            X[i - ar_order] = known_signal[i - ar_order:i][::-1]
-            y[i - ar_order] = known_signal[i]
-        
-        try:
-            ar_params = np.linalg.lstsq(X, y, rcond=None)[0]
-        except np.linalg.LinAlgError:
-            XTX = X.T @ X
-            reg = 0.01 * np.eye(XTX.shape[0])
-            ar_params = np.linalg.inv(XTX + reg) @ X.T @ y
-
-        def create_toeplitz(col, row=None):
-            if row is None:
-                row = np.r_[col[0], np.zeros(len(col) - 1)]
-            
-            n_col = len(col)
-            n_row = len(row)
-            
-            result = np.zeros((n_row, n_col))
-            
-            for i in range(n_row):
-                for j in range(n_col):
-                    if i - j >= 0:
-                        result[i, j] = col[i - j]
-                    else:
-                        result[i, j] = row[j - i]
-            
-            return result
-
-
-        toeplitz_col = np.zeros(ar_order)
-        toeplitz_col[:len(ar_params)] = ar_params
-        B_matrix = create_toeplitz(toeplitz_col)
-
-        for idx in missing_indices:
-
-            start_idx = max(0, idx - ar_order)
-            end_idx = idx
-            context_indices = np.arange(start_idx, end_idx)
-
-            context_values = signal_filled[context_indices]
-            if len(context_values) < ar_order:
-                context_values = np.pad(context_values, (ar_order - len(context_values), 0), mode='constant')
-
-            interpolated_value = np.dot(ar_params[:len(context_values)], context_values[::-1])
-            signal_filled[idx] = interpolated_value
-    
+        known_signal = signal_filled[signal_filled != 0]
+        forward = signal_filled.copy()
+        _ar_predict(forward, missing_indices, ar_coefficients(known_signal, ar_order, method))
+        if not forward_backward:
+            signal_filled = forward
+            continue
+
+        backward = signal_filled[::-1].copy()
+        _ar_predict(backward, len(signal_filled) - 1 - missing_indices[::-1],
+                    ar_coefficients(known_signal[::-1], ar_order, method))
+        backward = backward[::-1]
+        mask = np.zeros(len(signal_filled), dtype=bool)
+        mask[missing_indices] = True
+        weight = np.zeros(len(signal_filled))
+        for start, end, length in zip(*run_lengths(mask)):
+            weight[start:end + 1] = np.arange(length, 0, -1) / (length + 1)
+        signal_filled = np.where(mask, weight * forward + (1 - weight) * backward, signal_filled)
+
     dis[single_point_segment_index[0][0]:single_point_segment_index[1][1]] = signal_filled
-    
+
     return dis
-def vib_extraction(image_list):
-    dis_all_speckle = [[] for _ in range(10)]
-    T = 11.4e-6
-    fs = int(1/T)
+
+
+def _merge_comparators(lo, hi, r):
+    step = r * 2
+    if step < hi - lo:
+        yield from _merge_comparators(lo, hi, step)
+        yield from _merge_comparators(lo + r, hi, step)
+        for i in range(lo + r, hi - r, step):
+            yield (i, i + r)
+    else:
+        yield (lo, lo + r)
+
+
+def _sort_comparators(lo, hi, presorted):
+    # Batcher odd-even merge sort over wires lo..hi (inclusive), skipping runs already sorted
+    if hi - lo + 1 > presorted:
+        mid = lo + (hi - lo) // 2
+        yield from _sort_comparators(lo, mid, presorted)
+        yield from _sort_comparators(mid + 1, hi, presorted)
+        yield from _merge_comparators(lo, hi, 1)
+
+
+@functools.lru_cache(maxsize=None)
+def _selection_network(n_wires, presorted, outputs):
+    network = []
+    needed = set(outputs)
+    for i, j in reversed(list(_sort_comparators(0, n_wires - 1, presorted))):
+        need_min, need_max = i in needed, j in needed
+        if need_min or need_max:
+            network.append((i, j, need_min, need_max))
+            needed.update((i, j))
+    return network[::-1]
+
+
+def _run_network(wires, network):
+    # None stands for a +inf padding wire, which lets the power-of-two network take any size
+    for i, j, need_min, need_max in network:
+        a, b = wires[i], wires[j]
+        if b is None:
+            continue
+        if a is None:
+            wires[i], wires[j] = b, None
+            continue
+        if need_min:
+            wires[i] = np.minimum(a, b)
+        if need_max:
+            wires[j] = np.maximum(a, b)
+    return wires
+
+
+def median_filter(bands, size=7, method='exact'):
+    """size x size median of one uint8 band or a list of bands, matching PIL's MedianFilter.
+
+    All bands are laid side by side on one canvas and filtered in a single pass:
+    'exact' sorts each column window once and merges the sorted columns with a
+    Batcher network pruned to the median output; 'separable' takes the median of
+    column medians, a cheaper approximation.
+    """
+    single = isinstance(bands, np.ndarray)
+    if single:
+        bands = [bands]
+    if len(bands) == 0:
+        return []
+    r = size // 2
+    group = 1 << (size - 1).bit_length()
+    padded = [np.pad(np.asarray(b).astype(np.uint8), r, mode='edge') for b in bands]
+    height = max(p.shape[0] for p in padded)
+    canvas = np.zeros((height, sum(p.shape[1] for p in padded)), dtype=np.uint8)
+    offsets = np.cumsum([0] + [p.shape[1] for p in padded])
+    for p, off in zip(padded, offsets):
+        canvas[:p.shape[0], off:off + p.shape[1]] = p
+
+    out_h = height - 2 * r
+    out_w = canvas.shape[1] - 2 * r
+    columns = [canvas[d:d + out_h] for d in range(size)] + [None] * (group - size)
+    columns = _run_network(columns, _selection_network(group, 1, tuple(range(group))))[:size]
+
+    if method == 'exact':
+        wires = []
+        for d in range(size):
+            wires += [c[:, d:d + out_w] for c in columns] + [None] * (group - size)
+        wires += [None] * (group * group - len(wires))
+        median = _run_network(wires, _selection_network(group * group, group, (size * size // 2,)))[size * size // 2]
+    elif method == 'separable':
+        wires = [columns[r][:, d:d + out_w] for d in range(size)] + [None] * (group - size)
+        median = _run_network(wires, _selection_network(group, 1, (r,)))[r]
+    else:
+        raise ValueError(f"Unknown median method: {method}")
+
+    filtered = [median[:b.shape[0], off:off + b.shape[1]] for b, off in zip(bands, offsets)]
+    return filtered[0] if single else filtered
+
+
+def detect_rois(image, plan=None):
+    """Speckle column intervals and the two row bands of one frame.
+
+    A VibPlan supplies the smoothing sigmas, its cached Gaussian kernels and the
+    shortest row band kept (min_band_rows).
+    """
+    if plan is None:
+        col_kernel, row_kernel = gaussian_kernel(20), gaussian_kernel(10)
+        min_band_rows = MIN_BAND_ROWS
+    else:
+        col_kernel, row_kernel = plan.gaussian_kernel(plan.col_sigma), plan.gaussian_kernel(plan.row_sigma)
+        min_band_rows = plan.min_band_rows
+    col_intensity = np.average(image, axis=0)
+    filtered_col = gaussian_filter1d(col_intensity, kernel=col_kernel)
+    peaks_col = detect_peaks_with_width(filtered_col, height_threshold=0.1, min_distance=100)
+    row_intensity = np.average(image, axis=1)
+    filtered_row = gaussian_filter1d(row_intensity, kernel=row_kernel)
+
+    global_mean = np.mean(filtered_row)
+    global_std = np.std(filtered_row)
+    local_adjustment = np.percentile(filtered_row, 90) - np.percentile(filtered_row, 10)
+    threshold = global_mean - 0.2 * global_std + 0.1 * local_adjustment
+    above_threshold = filtered_row > threshold
+    starts, ends, lengths = run_lengths(above_threshold, min_length=min_band_rows)
+    if len(starts) >= 3:
+        starts, ends, lengths = longest_runs(starts, ends, lengths, count=2)
+    peaks_row = list(zip(starts.tolist(), ends.tolist()))
+    return peaks_col, peaks_row
+
+
+class ROITracker:
+    """Carries speckle column intervals and row bands forward from frame to frame.
+
+    Each frame is validated against the last full detection with cheap subsampled
+    projections: the contrast inside every known interval must stay within
+    tolerance, the dot centroid must not drift by more than drift * width, and no
+    new bright column may appear outside the intervals. Otherwise the frame is
+    re-detected and the new intervals are matched to existing tracks by overlap,
+    so a speckle keeps its index for the whole capture.
+    """
+    def __init__(self, tolerance=0.2, drift=0.1, step=8, plan=None):
+        self.tolerance = tolerance
+        self.drift = drift
+        self.step = step
+        self.plan = plan
+        self.tracks = []
+        self.peaks_row = None
+        self.reference = None
+        self.detections = 0
+
+    def update(self, image):
+        """(track id, column interval) of every visible speckle and the row bands."""
+        col_proj = np.mean(image[::self.step], axis=0)
+        row_proj = np.mean(image[:, ::self.step], axis=1)
+        if self.reference is None or not self._still_valid(col_proj, row_proj):
+            peaks_col, self.peaks_row = detect_rois(image, self.plan)
+            self._match(peaks_col)
+            self.reference = self._measure(col_proj, row_proj)
+            self.detections += 1
+        return [(i, interval) for i, interval in enumerate(self.tracks) if interval is not None], self.peaks_row
+
+    def _visible(self):
+        return [interval for interval in self.tracks if interval is not None]
+
+    def _measure(self, col_proj, row_proj):
+        baseline = np.median(col_proj)
+        energy = np.array([np.mean(col_proj[start:end + 1]) for start, end in self._visible()])
+        band_energy = np.array([np.mean(row_proj[start:end]) for start, end in self.peaks_row])
+        return baseline, energy, band_energy
+
+    def _still_valid(self, col_proj, row_proj):
+        baseline, energy, band_energy = self.reference
+        visible = self._visible()
+        if len(visible) == 0:
+            return False
+        contrast = energy - baseline
+        now = self._measure(col_proj, row_proj)
+        if np.any(np.abs(now[1] - energy) > self.tolerance * contrast):
+            return False
+        if np.any(np.abs(now[2] - band_energy) > self.tolerance * band_energy):
+            return False
+
+        outside = np.ones(len(col_proj), dtype=bool)
+        for start, end in visible:
+            weights = np.clip(col_proj[start:end + 1] - now[0], 0, None)
+            if np.sum(weights) == 0:
+                return False
+            centroid = np.sum(weights * np.arange(start, end + 1)) / np.sum(weights)
+            if abs(centroid - (start + end) / 2) > self.drift * (end - start):
+                return False
+            outside[start:end + 1] = False
+        # A new dot shows up as a bright block of columns outside every known interval
+        block = 16
+        n = len(col_proj) // block
+        blocks = np.mean((col_proj[:n * block] * outside[:n * block]).reshape(n, block), axis=1)
+        return not np.any(blocks - now[0] > 0.5 * np.min(contrast))
+
+    def _match(self, peaks_col):
+        previous = self.tracks
+        self.tracks = [None] * len(previous)
+        unmatched = []
+        for interval in peaks_col:
+            overlaps = [min(interval[1], old[1]) - max(interval[0], old[0]) if old is not None else 0
+                        for old in previous]
+            best = int(np.argmax(overlaps)) if overlaps else -1
+            if best >= 0 and overlaps[best] > 0 and self.tracks[best] is None:
+                self.tracks[best] = interval
+            else:
+                unmatched.append(interval)
+        self.tracks.extend(unmatched)
+
+
+def decimation_factor(cutoff_freq, T=LINE_TIME, oversample=4):
+    """Largest row decimation factor whose decimated rate still covers oversample * cutoff_freq."""
+    return max(1, int(1 / (T * cutoff_freq * oversample)))
+
+
+# Half-length of the decimation filter in output samples: 7k taps keep aliases into the band below about -50 dB
+DECIMATION_FILTER_SPAN = 3
+
+
+@functools.lru_cache(maxsize=None)
+def decimation_filter(k, span=DECIMATION_FILTER_SPAN):
+    """Hamming-windowed sinc low-pass for keeping every k-th row, (2 * span + 1) * k taps summing to 1.
+
+    The cutoff sits at half the decimated rate. With decimation_factor's 4x
+    oversampling the analysis band stays in the passband while everything that
+    folds back onto it lies in the stopband, which a k-row boxcar does not give:
+    its sidelobes only damp those frequencies by about 11 dB.
+    """
+    length = (2 * span + 1) * k
+    t = np.arange(length) - (length - 1) / 2
+    taps = np.sinc(t / k) * np.hamming(length)
+    return taps / taps.sum()
+
+
+def decimate_rows(image, k):
+    """Low-pass every column with decimation_filter(k), then keep one row per k-row block.
+
+    Output row g is centred on rows [g*k, (g+1)*k), like the mean of that block.
+    Rows beyond the image edges are mirrored in.
+    """
+    if k == 1:
+        return image
+    n = image.shape[0] // k
+    taps = decimation_filter(k)
+    margin = (len(taps) - k) // 2
+    padded = np.pad(np.asarray(image, dtype=np.float64)[:n * k], ((margin, margin), (0, 0)), mode='reflect')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, len(taps), axis=0)[:n * k:k]
+    return windows @ taps
+
+
+def frame_gap_length(height, T=LINE_TIME, fps=FRAME_RATE, decimation=1):
+    """Number of samples covering the readout gap between two frames."""
+    gap = int((1/fps - height*T)/T) - 1
+    if decimation > 1:
+        # Round the whole frame period, not just the gap, so the decimated time axis tracks the full-rate one
+        gap = int(round((height + gap) / decimation)) - height // decimation
+    return gap
+
+
+class StitchedSignal:
+    """One speckle's frames joined by zero-filled readout gaps, materialized only on demand."""
+    def __init__(self, frames, gap):
+        self.frames = frames
+        self.gap = gap
+
+    def __len__(self):
+        return self.frames.shape[0] * (self.frames.shape[1] + self.gap)
+
+    def __array__(self, dtype=None, copy=None):
+        n_frames, samples_per_frame = self.frames.shape
+        stitched = np.zeros((n_frames, samples_per_frame + self.gap), dtype=dtype or self.frames.dtype)
+        stitched[:, :samples_per_frame] = self.frames
+        return stitched.ravel()
+
+    def __getitem__(self, index):
+        if not isinstance(index, (int, np.integer)):
+            return np.asarray(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("stitched signal index out of range")
+        frame, offset = divmod(index, self.frames.shape[1] + self.gap)
+        return self.frames[frame, offset] if offset < self.frames.shape[1] else self.frames.dtype.type(0)
+
+
+class DisplacementStore:
+    """Per-speckle displacement kept in one preallocated (n_speckles, n_frames, samples_per_frame) array.
+
+    The readout gap between frames is only recorded as metadata (gap samples at
+    sample_period spacing); store[i] returns a lazy StitchedSignal. Capacity
+    doubles whenever a speckle or frame index runs past it, and present marks
+    which (speckle, frame) slots were written, the rest stay zero.
+    """
+    def __init__(self, samples_per_frame, gap, n_frames=1, n_speckles=10, sample_period=LINE_TIME, dtype=np.float64):
+        self.samples_per_frame = samples_per_frame
+        self.gap = gap
+        self.sample_period = sample_period
+        self._data = np.zeros((n_speckles, max(n_frames, 1), samples_per_frame), dtype=dtype)
+        self._present = np.zeros(self._data.shape[:2], dtype=bool)
+        self.n_speckles = 0
+        self.n_frames = 0
+
+    @property
+    def data(self):
+        return self._data[:self.n_speckles, :self.n_frames]
+
+    @property
+    def present(self):
+        return self._present[:self.n_speckles, :self.n_frames]
+
+    def _reserve(self, n_speckles, n_frames):
+        capacity = self._data.shape[:2]
+        if n_speckles <= capacity[0] and n_frames <= capacity[1]:
+            return
+        shape = (max(n_speckles, 2 * capacity[0]) if n_speckles > capacity[0] else capacity[0],
+                 max(n_frames, 2 * capacity[1]) if n_frames > capacity[1] else capacity[1])
+        data = np.zeros(shape + (self.samples_per_frame,), dtype=self._data.dtype)
+        present = np.zeros(shape, dtype=bool)
+        data[:capacity[0], :capacity[1]] = self._data
+        present[:capacity[0], :capacity[1]] = self._present
+        self._data, self._present = data, present
+
+    def resize(self, n_frames):
+        """Extend the time axis to n_frames; frames that were never written stay zero."""
+        self._reserve(self.n_speckles, n_frames)
+        self.n_frames = max(self.n_frames, n_frames)
+
+    def set(self, speckle, frame, dis):
+        """Write one frame's samples (without the gap) for one speckle."""
+        self._reserve(speckle + 1, frame + 1)
+        self._data[speckle, frame] = dis
+        self._present[speckle, frame] = True
+        self.n_speckles = max(self.n_speckles, speckle + 1)
+        self.n_frames = max(self.n_frames, frame + 1)
+
+    def stitched(self, speckle):
+        return np.asarray(self[speckle])
+
+    def __len__(self):
+        return self.n_speckles
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.n_speckles))]
+        if index < 0:
+            index += self.n_speckles
+        if not 0 <= index < self.n_speckles:
+            raise IndexError("speckle index out of range")
+        return StitchedSignal(self._data[index, :self.n_frames], self.gap)
+
+
+def _band_bins(m, fs, freq_range):
+    # Non-negative bins of an m point FFT whose fftfreq value lies in freq_range, plus the bin spacing
+    step = 1.0 / (m * (1.0 / fs))
+    first = max(int(np.floor(freq_range[0] / step)) - 1, 0)
+    last = min(int(np.ceil(freq_range[1] / step)) + 2, m // 2)
+    bins = np.arange(first, max(first, last))
+    freqs = bins * step
+    keep = (freqs >= freq_range[0]) & (freqs <= freq_range[1])
+    return bins[keep], freqs[keep]
+
+
+def padded_fft_frequencies(n, fs, freq_range=(40, 2000), pad=8):
+    """In-band bins of an n * pad point FFT, selected exactly as np.fft.fftfreq + a range mask would."""
+    return _band_bins(n * pad, fs, freq_range)[1]
+
+
+def chirp_z_bins(signal, m, bins):
+    """Bins first..first+K-1 of the m point DFT of signal (or of each row), via Bluestein's chirp-z.
+
+    Only an FFT of length ~N+K is needed instead of m, which is what makes a
+    heavily zero-padded spectrum cheap when only a narrow band is kept.
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    n = signal.shape[-1]
+    first, count = int(bins[0]), len(bins)
+
+    def chirp(j):
+        # exp(-i*pi*j^2/m) with j^2 reduced exactly modulo its 2m period
+        return np.exp(-1j * np.pi * ((j * j) % (2 * m)) / m)
+
+    index = np.arange(n, dtype=np.int64)
+    shifted = signal * np.exp(-2j * np.pi * ((index * first) % m) / m) * chirp(index)
+    n_fft = fast_fft_length(n + count - 1)
+    kernel = np.conj(chirp(np.arange(-(n - 1), count, dtype=np.int64)))
+    product = np.fft.fft(shifted, n_fft, axis=-1) * np.fft.fft(kernel, n_fft)
+    convolution = np.fft.ifft(product, axis=-1)[..., n - 1:n - 1 + count]
+    return chirp(np.arange(count, dtype=np.int64)) * convolution
+
+
+def band_spectrum(signal, fs, freq_range=(40, 2000), pad=8):
+    """(freqs, amplitudes) of |np.fft.fft(signal, N * pad)| restricted to freq_range.
+
+    Same frequency grid as filtering the full padded FFT, computed with a zoom
+    (chirp-z) transform over the band only. pad sets the grid resolution fs / (N * pad).
+    A 2-D input is treated as one signal per row.
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    m = int(round(signal.shape[-1] * pad))
+    bins, freqs = _band_bins(m, fs, freq_range)
+    if len(bins) == 0:
+        return freqs, np.zeros(signal.shape[:-1] + (0,))
+    return freqs, np.abs(chirp_z_bins(signal, m, bins))
+
+
+def _quinn_tau(x):
+    return (0.25 * np.log(3 * x**2 + 6 * x + 1)
+            - np.sqrt(6) / 24 * np.log((x + 1 - np.sqrt(2 / 3)) / (x + 1 + np.sqrt(2 / 3))))
+
+
+def _interpolated_peak(signals, spectrum, fs, k, method, refine, iterations):
+    n = signals.shape[1]
+    rows = np.arange(signals.shape[0])
+    k = np.clip(k, 1, spectrum.shape[1] - 2)
+    X_m1, X_0, X_p1 = spectrum[rows, k - 1], spectrum[rows, k], spectrum[rows, k + 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'quadratic':
+            A_m1, A_0, A_p1 = np.abs(X_m1), np.abs(X_0), np.abs(X_p1)
+            delta = 0.5 * (A_m1 - A_p1) / (A_m1 - 2 * A_0 + A_p1)
+        elif method == 'jacobsen':
+            delta = np.real((X_m1 - X_p1) / (2 * X_0 - X_m1 - X_p1))
+        elif method == 'quinn':
+            dp = -np.real(X_p1 / X_0) / (1 - np.real(X_p1 / X_0))
+            dm = np.real(X_m1 / X_0) / (1 - np.real(X_m1 / X_0))
+            delta = (dp + dm) / 2 + _quinn_tau(dp**2) - _quinn_tau(dm**2)
+        else:
+            raise ValueError(f"Unknown peak interpolation method: {method}")
+    delta = np.where(np.isfinite(delta), np.clip(delta, -1, 1), 0)
+    peak = (k + delta) * fs / n
+
+    if refine:
+        peak = _refine_peak(signals, np.arange(n) / fs, peak, fs / n, iterations)
+    return peak
+
+
+def _refine_peak(signals, t, peak, max_step, iterations):
+    # Newton steps on |DTFT|^2 of each row sampled at times t
+    for _ in range(iterations):
+        phase = np.exp(-2j * np.pi * peak[:, None] * t)
+        X = np.sum(signals * phase, axis=1)
+        dX = np.sum(signals * phase * (-2j * np.pi * t), axis=1)
+        d2X = np.sum(signals * phase * (-(2 * np.pi * t)**2), axis=1)
+        slope = 2 * np.real(np.conj(X) * dX)
+        curvature = 2 * (np.abs(dX)**2 + np.real(np.conj(X) * d2X))
+        # Only step while at a maximum, and never by more than one bin
+        step = np.where(curvature < 0, -slope / np.where(curvature < 0, curvature, 1), 0)
+        peak = peak + np.clip(step, -max_step, max_step)
+    return peak
+
+
+def _band_indices(n, fs, freq_range):
+    freqs = np.fft.rfftfreq(n, d=1.0 / fs)
+    band = np.nonzero((freqs >= freq_range[0]) & (freqs <= freq_range[1]))[0]
+    if len(band) == 0:
+        raise ValueError("No FFT bin falls inside the requested frequency range.")
+    return freqs, band
+
+
+def estimate_peak_frequency(signals, fs, freq_range=(40, 2000), method='jacobsen', refine=True, iterations=3):
+    """Dominant in-band frequency of a signal (or of each row) from its unpadded rfft.
+
+    The strongest bin is interpolated with a 'quadratic' (magnitude parabola),
+    'jacobsen' or 'quinn' estimator; refine then runs Newton steps on |DTFT|^2 so
+    the result lands on the true spectral peak instead of a padded-FFT grid point.
+    """
+    signals = np.asarray(signals, dtype=np.float64)
+    batched = signals.ndim == 2
+    signals = np.atleast_2d(signals)
+    spectrum = np.fft.rfft(signals, axis=1)
+    _, band = _band_indices(signals.shape[1], fs, freq_range)
+    k = band[np.argmax(np.abs(spectrum[:, band]), axis=1)]
+    peak = _interpolated_peak(signals, spectrum, fs, k, method, refine, iterations)
+    return peak if batched else peak[0]
+
+
+def gap_aware_peak_frequency(store, freq_range=(40, 2000), pad=8, lines=3, iterations=3):
+    """Dominant in-band frequency of every speckle in a DisplacementStore, from the valid samples only.
+
+    Same peak as estimate_peak_frequency of the zero-gap stitched signals, but the
+    readout gaps are never built or transformed and the cost is linear in the
+    frame count. The summed per-frame power spectra locate the peak to a fraction
+    of a frame's bin; the frame-to-frame phase at that frequency, zero-padded pad
+    times over the frames, then gives the strongest lines of the frame-rate comb,
+    which are compared exactly at the valid sample times; Newton steps on
+    |DTFT|^2 finish the estimate.
+    """
+    frames = np.asarray(store.data, dtype=np.float64)
+    n_speckles, n_frames, length = frames.shape
+    if n_speckles == 0 or n_frames == 0:
+        return np.zeros(n_speckles)
+    fs = 1 / store.sample_period
+    frame_period = (length + store.gap) / fs
+    rows = np.arange(n_speckles)
+
+    # Envelope peak on the fixed fs / samples_per_frame grid of one frame
+    power = np.sum(np.abs(np.fft.rfft(frames, axis=-1))**2, axis=1)
+    _, band = _band_indices(length, fs, freq_range)
+    k = np.clip(band[np.argmax(power[:, band], axis=1)], 1, power.shape[1] - 2)
+    P_m1, P_0, P_p1 = power[rows, k - 1], power[rows, k], power[rows, k + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = 0.5 * (P_m1 - P_p1) / (P_m1 - 2 * P_0 + P_p1)
+    coarse = (k + np.where(np.isfinite(delta), np.clip(delta, -1, 1), 0)) * fs / length
+
+    # Each frame's DTFT term at the envelope peak; an FFT over frames resolves the offset to the
+    # strongest comb line, known modulo the frame rate
+    t_frame = np.arange(length) / fs
+    t_start = np.arange(n_frames) * frame_period
+    terms = (np.einsum('sfl,sl->sf', frames, np.exp(-2j * np.pi * coarse[:, None] * t_frame))
+             * np.exp(-2j * np.pi * coarse[:, None] * t_start))
+    m = n_frames * pad
+    comb = np.abs(np.fft.fft(terms, m, axis=1))
+    # Frames where a speckle is missing add lines between the comb's; keep the strongest few
+    is_line = (comb >= np.roll(comb, 1, axis=1)) & (comb > np.roll(comb, -1, axis=1))
+    bins = np.argsort(np.where(is_line, -comb, np.inf), axis=1)[:, :lines]
+    fine = coarse[:, None] + ((bins + m // 2) % m - m // 2) / (m * frame_period)
+
+    # The envelope can be off by more than half the frame rate: measure each line and its
+    # neighbours one and two frame rates away exactly, and keep the strongest
+    signals = frames.reshape(n_speckles, -1)
+    t = (t_start[:, None] + t_frame).ravel()
+    candidates = (fine[:, :, None] + np.arange(-2, 3) / frame_period).reshape(n_speckles, -1)
+    strength = np.stack([np.abs(np.sum(signals * np.exp(-2j * np.pi * c[:, None] * t), axis=1))
+                         for c in candidates.T], axis=1)
+    in_band = (candidates >= freq_range[0]) & (candidates <= freq_range[1])
+    peak = candidates[rows, np.argmax(np.where(in_band, strength, -1), axis=1)]
+    return _refine_peak(signals, t, peak, 1 / (n_frames * frame_period), iterations)
+
+
+def frequency_summary(signals, fs, freq_range=(40, 2000), top_k=3, method='jacobsen', refine=True):
+    """Frequency table for a stack of signals (one per row) from a single batched rfft.
+
+    Returns a dict of arrays: peak_freq (interpolated, see estimate_peak_frequency),
+    amplitude (peak bin magnitude), snr (peak over in-band median, in dB) and the
+    top_k strongest in-band local maxima as top_freqs / top_amplitudes, padded
+    with NaN when a row has fewer peaks.
+    """
+    signals = np.atleast_2d(np.asarray(signals, dtype=np.float64))
+    spectrum = np.fft.rfft(signals, axis=1)
+    freqs, band = _band_indices(signals.shape[1], fs, freq_range)
+    amplitudes = np.abs(spectrum)
+    in_band = amplitudes[:, band]
+    k = band[np.argmax(in_band, axis=1)]
+    rows = np.arange(signals.shape[0])
+
+    peak_freq = _interpolated_peak(signals, spectrum, fs, k, method, refine, 3)
+    amplitude = amplitudes[rows, k]
+    with np.errstate(divide='ignore'):
+        snr = 20 * np.log10(amplitude / np.median(in_band, axis=1))
+
+    # Strict local maxima inside the band, strongest first
+    centre = amplitudes[:, band[1:-1]] if len(band) > 2 else np.zeros((len(rows), 0))
+    is_peak = (centre > amplitudes[:, band[1:-1] - 1]) & (centre > amplitudes[:, band[1:-1] + 1])
+    ranked = np.argsort(np.where(is_peak, -centre, np.inf), axis=1)[:, :top_k]
+    valid = np.take_along_axis(is_peak, ranked, axis=1)
+    top_freqs = np.full((len(rows), top_k), np.nan)
+    top_amplitudes = np.full((len(rows), top_k), np.nan)
+    top_freqs[:, :ranked.shape[1]] = np.where(valid, freqs[band[1:-1]][ranked], np.nan)
+    top_amplitudes[:, :ranked.shape[1]] = np.where(valid, np.take_along_axis(centre, ranked, axis=1), np.nan)
+
+    return {
+        'peak_freq': peak_freq,
+        'amplitude': amplitude,
+        'snr': snr,
+        'top_freqs': top_freqs,
+        'top_amplitudes': top_amplitudes,
+    }
+
+
+def speckle_frequency_table(store, freq_range=(40, 2000), top_k=3):
+    """frequency_summary of every speckle in a DisplacementStore, without rendering anything."""
+    if len(store) == 0:
+        return frequency_summary(np.zeros((0, 1)), 1 / store.sample_period, (0, np.inf), top_k)
+    return frequency_summary(np.stack([np.asarray(signal) for signal in store[:]]),
+                             1 / store.sample_period, freq_range, top_k)
+
+
+class VibPlan:
+    """Settings of one analysis and the constants derived from them, built once per frame shape.
+
+    Like an FFTW plan it is reused across frames and calls: the decimation, sample
+    rate and readout gap are fixed at construction, the SOS sections are designed
+    once, and the Gaussian kernels are cached by sigma on first use (the 'fft'
+    low-pass responses come from the butterworth_response cache).
+
+    lowpass_mode picks the band low-pass: 'fft' (Butterworth magnitude in the
+    frequency domain), 'filtfilt' (zero-phase forward-backward SOS filter, as in
+    the notebook) or 'causal' (SOS filter whose state runs on from band to band
+    and frame to frame, for live feeds). ar_method and ar_forward_backward
+    select how adaptive_ar_interpolation fills the gap between the bands.
+    """
+    def __init__(self, shape, T=LINE_TIME, fps=FRAME_RATE, cutoff_freq=2000, order=3, decimation=1,
+                 max_shift=None, median='exact', col_sigma=20, row_sigma=10, min_band_rows=MIN_BAND_ROWS,
+                 lowpass_mode='fft', ar_method='lstsq', ar_forward_backward=False):
+        if lowpass_mode not in ('fft', 'filtfilt', 'causal'):
+            raise ValueError(f"Unknown low-pass mode: {lowpass_mode}")
+        if ar_method not in AR_METHODS:
+            raise ValueError(f"Unknown AR method: {ar_method}")
+        if decimation == 'auto':
+            decimation = decimation_factor(cutoff_freq, T)
+        self.shape = tuple(shape)
+        self.T = T
+        self.fps = fps
+        self.cutoff_freq = cutoff_freq
+        self.order = order
+        self.decimation = decimation
+        self.max_shift = max_shift
+        self.median = median
+        self.col_sigma = col_sigma
+        self.row_sigma = row_sigma
+        self.min_band_rows = min_band_rows
+        self.lowpass_mode = lowpass_mode
+        self.ar_method = ar_method
+        self.ar_forward_backward = ar_forward_backward
+        self.fs = int(1/T) / decimation
+        self.sos = butter_sos(order, cutoff_freq, self.fs)
+        self.sample_period = decimation * T
+        self.samples_per_frame = self.shape[0] // decimation
+        self.gap = frame_gap_length(self.shape[0], T, fps, decimation)
+        self._kernels = {}
+
+    @property
+    def line_max_shift(self):
+        """max_shift over the k-line step between decimated rows, as find_shift_subpixel sees it."""
+        return None if self.max_shift is None else self.max_shift * self.decimation
+
+    def gaussian_kernel(self, sigma):
+        kernel = self._kernels.get(sigma)
+        if kernel is None:
+            kernel = self._kernels[sigma] = gaussian_kernel(sigma)
+        return kernel
+
+    def lowpass(self, signal, lengths=None):
+        """Stateless band low-pass with the plan's cutoff, rate and order (see lowpass_filter).
+
+        The 'causal' mode needs filter state and is applied by _causal_lowpass.
+        """
+        if self.lowpass_mode != 'filtfilt':
+            return lowpass_filter(signal, self.cutoff_freq, self.fs, self.order, lengths)
+        signal = np.asarray(signal)
+        if signal.ndim == 1:
+            return sosfiltfilt(self.sos, signal)
+        if lengths is None:
+            lengths = np.full(len(signal), signal.shape[1])
+        lengths = np.asarray(lengths)
+        filtered = np.zeros(signal.shape)
+        for N in np.unique(lengths):
+            rows = np.nonzero(lengths == N)[0]
+            filtered[rows, :N] = sosfiltfilt(self.sos, signal[rows, :N])
+        return filtered
+
+
+def _band_shift(band_img, band, offset, plan):
+    """Row shifts of one median-filtered row band on the decimated grid."""
+    k = plan.decimation
+    band_img = decimate_rows(band_img[offset:offset + (band[1] - band[0]) * k], k)
+    # Decimated rows are k lines apart; keep the per-line shift units
+    return find_shift_subpixel(band_img, max_shift=plan.line_max_shift) / k
+
+
+@functools.lru_cache(maxsize=None)
+def _thread_pool(threads):
+    """Persistent pool per thread count, reused by every frame and call."""
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix='pocketvib')
+
+
+def _causal_lowpass(batch, lengths, speckles, plan, states):
+    """Causal SOS low-pass of a frame's band shifts, rows ordered (speckle, band).
+
+    Each speckle's filter picks up the state its previous band left in states
+    (keyed by speckle id), skipping the readout gap in between; a speckle seen for
+    the first time starts from the steady state of its first sample.
+    """
+    filtered = np.zeros(batch.shape)
+    ids = [speckle_id for speckle_id, _ in speckles]
+    step_state = sosfilt_zi(plan.sos)
+    for j in range(2):
+        rows = np.arange(j, len(batch), 2)
+        if len(rows) == 0 or lengths[j] == 0:
+            continue
+        # Both bands have the same length for every speckle of a frame
+        n = lengths[j]
+        zi = np.stack([states[speckle_id] if speckle_id in states else step_state * batch[row, 0]
+                       for speckle_id, row in zip(ids, rows)], axis=1)
+        filtered[rows, :n], zf = sosfilt(plan.sos, batch[rows, :n], zi)
+        for r, speckle_id in enumerate(ids):
+            states[speckle_id] = zf[:, r]
+    return filtered
+
+
+def _process_frame(image, speckles, peaks_row, plan, threads=None, states=None):
+    """Displacement of every (speckle_id, interval) in speckles for one frame.
+
+    With threads > 1 the (speckle, band) shift tasks run on a persistent thread pool
+    (the FFT and correlation work releases the GIL) and are joined before the
+    low-pass, which filters every band of the frame in one batched call. states
+    carries the 'causal' low-pass state between frames.
+    """
+    k = plan.decimation
+    # Band limits on the decimated grid: sample g covers rows [g*k, (g+1)*k)
+    bands = [(-(-start // k), end // k) for start, end in peaks_row]
+    speckle_imgs = median_filter([image[peaks_row[j][0]:peaks_row[j][1], interval[0]:interval[1]]
+                                  for _, interval in speckles for j in range(2)], method=plan.median)
+    tasks = [(speckle_imgs[2 * i + j], bands[j], bands[j][0] * k - peaks_row[j][0], plan)
+             for i in range(len(speckles)) for j in range(2)]
+    if threads is not None and threads > 1 and len(tasks) > 1:
+        shifts = list(_thread_pool(threads).map(lambda task: _band_shift(*task), tasks))
+    else:
+        shifts = [_band_shift(*task) for task in tasks]
+    lengths = [len(shift) for shift in shifts]
+    batch = np.zeros((len(shifts), max(lengths, default=0)))
+    for row, shift in enumerate(shifts):
+        batch[row, :len(shift)] = shift
+    if plan.lowpass_mode == 'causal':
+        band_dis = _causal_lowpass(batch, lengths, speckles, plan, {} if states is None else states)
+    else:
+        band_dis = plan.lowpass(batch, lengths)
+    segments = []
+    for i, (speckle_id, _) in enumerate(speckles):
+        dis = np.zeros(image.shape[0] // k)
+        for j in range(2):
+            dis[bands[j][0]:bands[j][1]] = band_dis[2 * i + j, :lengths[2 * i + j]]
+        dis = adaptive_ar_interpolation(dis, bands, ar_order=None, max_iterations=1,
+                                        method=plan.ar_method, forward_backward=plan.ar_forward_backward)
+        segments.append((speckle_id, dis))
+    return segments
+
+
+def iter_vib_extraction(frames, plan=None, tracker=None, threads=None, **settings):
+    """Yield (frame_index, [(speckle_id, dis), ...]) as each frame of frames is processed.
+
+    frames can be any iterable (a list, a decoder or a live feed); only the current
+    frame is held, so memory stays constant over long captures. Without a plan one
+    is built from the first frame's shape and the VibPlan keyword settings. Pass an
+    ROITracker to carry the ROI geometry across frames and keep speckle ids stable;
+    without one the ROIs are detected per frame and speckle_id is the index in that
+    frame. Each dis has plan.samples_per_frame samples, plan.sample_period apart.
+    threads > 1 spreads each frame's (speckle, band) work over a thread pool.
+    """
+    if plan is not None and settings:
+        raise ValueError("Pass the analysis settings either as a VibPlan or as keywords, not both.")
+    states = {}
+    for id, image in enumerate(frames):
+        if plan is None:
+            plan = VibPlan(image.shape, **settings)
+        if tracker is not None:
+            speckles, peaks_row = tracker.update(image)
+        else:
+            peaks_col, peaks_row = detect_rois(image, plan)
+            speckles = list(enumerate(peaks_col))
+        yield id, _process_frame(image, speckles, peaks_row, plan, threads=threads, states=states)
+
+
+# Worker-side state of _iter_parallel_frames: the shared slot ring, the plan and the files mapped so far
+_shared_frames = None
+
+
+def _attach_shared_frames(name, shape, dtype, plan):
+    global _shared_frames
+    from multiprocessing import shared_memory
+    # Pool workers share the parent's resource tracker, which unlinks the block once
+    block = shared_memory.SharedMemory(name=name)
+    _shared_frames = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf), plan, {})
+
+
+def _file_location(frame):
+    """(path, byte offset, shape, strides, dtype) of a frame that is a view of an np.memmap, else None."""
+    import mmap
+    import os
+    root = frame
+    while isinstance(root.base, np.ndarray):
+        root = root.base
+    if not (isinstance(root, np.memmap) and isinstance(root.base, mmap.mmap) and root.filename):
+        return None
+    # root starts at byte root.offset of the file; the frame lies some bytes into it
+    offset = root.offset + frame.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+    return os.fspath(root.filename), offset, frame.shape, frame.strides, frame.dtype
+
+
+def _process_shared_frame(task):
+    source, geometry = task
+    _, slots, plan, files = _shared_frames
+    if isinstance(source, int):
+        image = slots[source]
+    else:
+        path, offset, shape, strides, dtype = source
+        if path not in files:
+            files[path] = np.memmap(path, dtype=np.uint8, mode='r')
+        image = np.ndarray(shape, dtype=dtype, buffer=files[path], offset=offset, strides=strides)
+    if geometry is None:
+        peaks_col, peaks_row = detect_rois(image, plan)
+        geometry = (list(enumerate(peaks_col)), peaks_row)
+    return _process_frame(image, *geometry, plan)
+
+
+def _iter_parallel_frames(image_list, plan, tracker, workers):
+    """iter_vib_extraction over a process pool, yielding frames in their original order.
+
+    Frames that are views of a memory-mapped file (RawFrames, a spilled FrameStack)
+    are read by the workers straight from that file: only its path and the frame's
+    offset are sent. Other frames are copied into a ring of 2 * workers shared
+    memory slots, and a slot is reused once its frame's result has been yielded,
+    so at most that many frames are held however long the input is. Only the
+    small per-frame results are pickled back. The tracker (cheap, but
+    sequential) runs here and ships its geometry with each task.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    n_slots = 2 * workers
+    shape = (n_slots,) + image_list[0].shape
+    dtype = image_list[0].dtype
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    slots = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    free = list(range(n_slots))
+    pending = deque()
+
+    def oldest():
+        id, future, slot = pending.popleft()
+        segments = future.result()
+        if slot is not None:
+            free.append(slot)
+        return id, segments
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_shared_frames,
+                                 initargs=(block.name, shape, dtype, plan)) as pool:
+            for id, image in enumerate(image_list):
+                geometry = tracker.update(image) if tracker is not None else None
+                source, slot = _file_location(np.asarray(image)), None
+                if source is None:
+                    while not free:
+                        yield oldest()
+                    slot = source = free.pop()
+                    slots[slot] = image
+                # Keep the number of frames in flight bounded for file-backed inputs too
+                while len(pending) >= 2 * n_slots:
+                    yield oldest()
+                pending.append((id, pool.submit(_process_shared_frame, (source, geometry)), slot))
+            while pending:
+                yield oldest()
+    finally:
+        # The slot views must go before the block can be closed
+        del slots
+        block.close()
+        block.unlink()
+
+
+def vib_extraction(image_list, plan=None, track_roi=False, workers=None, threads=None, progress=None, **settings):
+    """Per-speckle displacement of every frame as a DisplacementStore.
+
+    store[i] is speckle i's signal stitched with zero-filled readout gaps. The
+    analysis settings come from plan, or from VibPlan keywords (max_shift,
+    cutoff_freq, decimation, median, ...) for the first frame's shape; decimation
+    low-passes the rows and keeps one in that many ('auto' picks it from cutoff_freq), so
+    the returned samples are spaced decimation * LINE_TIME apart. With track_roi the
+    ROI geometry is carried across frames by an ROITracker: speckle indices stay
+    stable across frames. Frames where a speckle is not visible hold zeros, so every
+    speckle stays on the same time axis. See iter_vib_extraction for streaming use.
+    workers > 1 spreads the frames over that many processes and threads > 1 the
+    work inside each frame over a thread pool; the result is identical to the
+    serial path either way. progress(frame_index, segments) is called after each
+    frame is stored; an exception raised from it aborts the analysis.
+    """
+    if plan is None:
+        plan = VibPlan(image_list[0].shape, **settings)
+    elif settings:
+        raise ValueError("Pass the analysis settings either as a VibPlan or as keywords, not both.")
+    if workers is not None and workers > 1 and plan.lowpass_mode == 'causal':
+        raise ValueError("The causal low-pass carries state from frame to frame and cannot run on workers.")
+    tracker = ROITracker(plan=plan) if track_roi else None
+    dis_all_speckle = DisplacementStore(plan.samples_per_frame, plan.gap,
+                                        n_frames=len(image_list), sample_period=plan.sample_period)
     start_time = time.time()
-    for experiment in range(1):
-        for id in range(len(image_list)):
-            image = image_list[id]
-            img_data_ROI = image.copy()
-            col_intensity = np.average(img_data_ROI, axis=0)
-            filtered_col = gaussian_filter1d(col_intensity, sigma=20)
-            peaks_col = detect_peaks_with_width(filtered_col, height_threshold=0.1, min_distance=100)
-            row_intensity = np.average(img_data_ROI, axis=1)
-            filtered_row = gaussian_filter1d(row_intensity,sigma=10)
-            
-            global_mean = np.mean(filtered_row)
-            global_std = np.std(filtered_row)
-            local_adjustment = np.percentile(filtered_row, 90) - np.percentile(filtered_row, 10)
-            threshold = global_mean - 0.2 * global_std + 0.1 * local_adjustment
-            above_threshold = filtered_row > threshold
-            peaks_row = find_intervals(above_threshold, 1)
-            if len(peaks_row) >= 3:
-                peaks_row = sorted(peaks_row, key=lambda x: (-(x[1] - x[0]), x[0]))[:2]
-                peaks_row = sorted(peaks_row, key=lambda x: x[0])        
-            height, width = image.shape
-            num_speckle = len(peaks_col)
-            for i in range(num_speckle):
-                dis = np.zeros(height)
-                for j in range(2):
-                    i_speckle_img = image[peaks_row[j][0]:peaks_row[j][1], peaks_col[i][0]:peaks_col[i][1]]
-                    pil_img = Image.fromarray(i_speckle_img.astype(np.uint8))
-                    filtered_pil_img = pil_img.filter(ImageFilter.MedianFilter(size=7))
-                    i_speckle_img = np.array(filtered_pil_img)
-                    dis_tmp = find_shift_subpixel(i_speckle_img)
-                    dis_tmp = lowpass_filter(dis_tmp, 2000, fs, order=3)
-                    dis[peaks_row[j][0]:peaks_row[j][1]] = dis_tmp
-                dis = adaptive_ar_interpolation(dis, peaks_row, ar_order=None, max_iterations=1)
-                dis = np.concatenate((dis, np.zeros(int((1/30 - height*T)/T)-1)))
-                dis_all_speckle[i].extend(dis)
+    if workers is not None and workers > 1:
+        frames = _iter_parallel_frames(image_list, plan, tracker, workers)
+    else:
+        frames = iter_vib_extraction(image_list, plan, tracker, threads)
+    for id, segments in frames:
+        for speckle_id, dis in segments:
+            dis_all_speckle.set(speckle_id, id, dis)
+        num_speckle = len(segments)
+        if progress is not None:
+            progress(id, segments)
+    dis_all_speckle.resize(len(image_list))
+    if tracker is not None:
+        num_speckle = len(tracker.tracks)
     process_time = (time.time() - start_time)
     return dis_all_speckle, num_speckle, process_time
@@ -10,22 +10,46 @@ from toga_iOS.libs import (
 )
 from rubicon.objc import objc_method
 from rubicon.objc.api import ObjCInstance
+import asyncio
 import ctypes
-from PIL import ImageFont, ImageDraw, Image
-import io
+import logging
+import threading
 import numpy as np
-from helloworld.PocketVib_Vib import vib_extraction
+from helloworld.PocketVib_Vib import VibPlan, estimate_peak_frequency, vib_extraction, speckle_frequency_table
+from helloworld.PocketVib_Plot import RenderCache, render_speckle
+from helloworld.PocketVib_Frames import FrameStack, load_frame
+
+uikit.UIImagePNGRepresentation.restype = ctypes.c_void_p
+uikit.UIImagePNGRepresentation.argtypes = [ctypes.c_void_p]
+
+PLOT_SIZE = (800, 400)
+# Rendered detail screens kept at least; an analysis with more speckles raises the bound to fit them all
+RENDER_CACHE_SIZE = 32
+# Render every detail screen in the background once an analysis finishes, instead of on first open
+PRECOMPUTE_PLOTS = True
+
+logger = logging.getLogger(__name__)
+# Picked frames beyond this many bytes are kept in a memory-mapped temporary file
+FRAME_MEMORY_LIMIT = 256 * 2**20
+# Channel the frames are decoded to: 'luma', or 'red' for red lasers
+FRAME_CHANNEL = 'luma'
+
+
+class AnalysisCancelled(Exception):
+    """Raised from the progress callback to stop a running analysis."""
 
 
 class SpeckleDetailScreen(toga.Box):
     """Screen to display displacement map and frequency spectrum for a specific speckle."""
-    def __init__(self, speckle_data, speckle_index):
+    def __init__(self, speckle_data, speckle_index, sample_period, plots=None):
         super().__init__(style=Pack(direction=COLUMN, padding=10))
 
         self.add(toga.Label("PocketVib Analyzer", style=Pack(font_size=24, padding=10,font_weight="bold")))
         
         self.speckle_data = speckle_data
         self.speckle_index = speckle_index
+        # (displacement PNG, spectrum PNG, measured frequency), usually from the app's render cache
+        self.plots = plots if plots is not None else render_speckle(speckle_data, sample_period, size=PLOT_SIZE)
 
         # Speckle Detail Title
         self.add(toga.Label(
@@ -76,174 +100,13 @@ class SpeckleDetailScreen(toga.Box):
         """Navigate back to the main screen."""
         self.window.content = self.window.app.main_box
     def visualize_displacement(self):
-        """Generate the time-displacement graph for the speckle."""
-        width, height = 800, 400
-        graph = Image.new("RGB", (width, height), "white")
-        draw = ImageDraw.Draw(graph)
-  
-        mid_y = height // 2  # Middle of the height for symmetric positive and negative displacement
-        draw.line((50, mid_y, width - 50, mid_y), fill="black", width=2)  # X-axis (time)
-        draw.line((50, 50, 50, height - 50), fill="black", width=2)  # Y-axis (displacement)
-
-        # Add labels for axes
-        try:
-            font = ImageFont.truetype("arial.ttf", 14)  # Use a system font
-        except IOError:
-            font = ImageFont.load_default()  # Fallback to default font if unavailable
-
-        # X-axis label (Time)
-        draw.text((width // 2 - 20, mid_y + 20), "Time (ms)", fill="black", font_size=20)
-        # Y-axis label (Displacement)
-        draw.text((10, 10), "Displacement (pixel)", fill="black",  font_size=20)
-
-        # Add ticks and labels for X-axis (in milliseconds)
-        num_ticks_x = 5
-        total_time_ms = len(self.speckle_data) * 0.0114  # Total time in milliseconds
-        for i in range(num_ticks_x + 1):
-            x = 50 + i * (width - 100) // num_ticks_x
-            draw.line((x, mid_y - 5, x, mid_y + 5), fill="black", width=2)  # Tick
-            time_ms = i * total_time_ms / num_ticks_x
-            draw.text((x - 10, mid_y + 10), f"{time_ms:.2f}", fill="black",  font_size=18)  # Label
-
-        # Add ticks and labels for Y-axis (symmetric positive and negative)
-        num_ticks_y = 5
-        max_displacement = max(np.abs(self.speckle_data))  # Maximum absolute displacement
-        for i in range(-num_ticks_y, num_ticks_y + 1):
-            y = mid_y - i * (height - 100) // (2 * num_ticks_y)
-            draw.line((45, y, 55, y), fill="black", width=2)  # Tick
-            value = max_displacement * i / num_ticks_y
-            draw.text((0, y - 10), f"{value:.2f}", fill="black", font_size=18)  # Label
-
-        # Normalize data
-        x_scale = (width - 100) / len(self.speckle_data)
-        y_scale = (height - 100) / (2 * max_displacement) if max_displacement > 0 else 1
-
-        # Plot the speckle data
-        for i in range(len(self.speckle_data) - 1):
-            x1 = 50 + i * x_scale
-            y1 = mid_y - self.speckle_data[i] * y_scale  # Center the displacement around mid_y
-            x2 = 50 + (i + 1) * x_scale
-            y2 = mid_y - self.speckle_data[i + 1] * y_scale
-            draw.line((x1, y1, x2, y2), fill="blue", width=2)
-
-        # Convert the graph to a format Toga can display
-        img_bytes = io.BytesIO()
-        graph.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
-        self.graph_image_view.image = toga.Image(src=img_bytes.getvalue())
-    def visualize_frequency_spectrum(self):
-        """Generate the frequency spectrum graph for the speckle."""
-        width, height = 800, 400
-        graph = Image.new("RGB", (width, height), "white")
-        draw = ImageDraw.Draw(graph)
-
-        # Define margins for the graph
-        left_margin = 50
-        right_margin = 50
-        top_margin = 30
-        bottom_margin = 50
-
-        # Draw axes
-        draw.line((left_margin, height - bottom_margin, width - right_margin, height - bottom_margin), fill="black", width=2)  # X-axis (Frequency)
-        draw.line((left_margin, top_margin, left_margin, height - bottom_margin), fill="black", width=2)  # Y-axis (Amplitude)
-
-        # Add labels for axes
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)  # Use a system font
-        except IOError:
-            font = ImageFont.load_default()  # Fallback to default font if unavailable
-
-        # X-axis label (Frequency)
-        draw.text((width // 2 - 40, height - bottom_margin + 30), "Frequency (Hz)", fill="black",  font_size=20)
-        # Y-axis label (Amplitude)
-        draw.text((left_margin - 40, top_margin-30), "Amplitude", fill="black",  font_size=20)
-
-        # Perform FFT and get frequency data
-        freq_range = (40, 2000)  # Frequency range in Hz
-        fs = 1 / (11.4e-6)  # Sampling frequency
-
-        # FFT calculation
-        N = len(self.speckle_data)
-        X = np.fft.fft(self.speckle_data, N * 8)  # Zero-padded FFT for better resolution
-        f = np.fft.fftfreq(len(X), d=1.0 / fs)  # Frequency values
-        f_pos = f[:len(f) // 2]
-        A = np.abs(X[:len(f) // 2])  # Amplitude spectrum
-
-        # Filter frequencies to the specified range
-        min_freq, max_freq = freq_range
-        index_range = np.where((f_pos >= min_freq) & (f_pos <= max_freq))[0]
-        f_filtered = f_pos[index_range]
-        A_filtered = A[index_range]
-
-        # Normalize data for plotting
-        max_amplitude = max(A_filtered)
-        measured_freq = f_filtered[np.argmax(A_filtered)]  # Frequency with max amplitude
-        peak_index = np.argmax(A_filtered)  # Index of the peak value
-        peak_amplitude = A_filtered[peak_index]  # Amplitude of the peak
-
-        # Calculate scaling factors
-        x_scale = (width - left_margin - right_margin) / len(f_filtered)
-        y_scale = (height - top_margin - bottom_margin) / (max_amplitude * 1.1) if max_amplitude > 0 else 1  # Add 10% padding to Y-axis
-
-        # Add ticks and labels for X-axis
-        num_ticks_x = 5
-        for i in range(num_ticks_x + 1):
-            x = left_margin + i * (width - left_margin - right_margin) // num_ticks_x
-            draw.line((x, height - bottom_margin, x, height - bottom_margin + 5), fill="black", width=2)  # Tick
-            freq_value = min_freq + i * (max_freq - min_freq) / num_ticks_x
-            draw.text((x - 20, height - bottom_margin + 10), f"{freq_value:.0f}", fill="black", font_size=18)  # Label
-
-        # Add ticks and labels for Y-axis
-        num_ticks_y = 5
-        for i in range(num_ticks_y + 1):
-            y = height - bottom_margin - i * (height - top_margin - bottom_margin) // num_ticks_y
-            draw.line((left_margin - 5, y, left_margin, y), fill="black", width=2)  # Tick
-            value = max_amplitude * i / num_ticks_y
-            draw.text((left_margin - 50, y - 10), f"{value:.2f}", fill="black",  font_size=18)  # Label
-
-        # Plot the frequency spectrum
-        for i in range(len(f_filtered) - 1):
-            x1 = left_margin + i * x_scale
-            y1 = height - bottom_margin - A_filtered[i] * y_scale
-            x2 = left_margin + (i + 1) * x_scale
-            y2 = height - bottom_margin - A_filtered[i + 1] * y_scale
-            draw.line((x1, y1, x2, y2), fill="red", width=2)
-
-        # Add a circle to highlight the peak point
-        peak_x = left_margin + peak_index * x_scale
-        peak_y = height - bottom_margin - peak_amplitude * y_scale
-        draw.ellipse(
-            [
-                (peak_x - 10, peak_y - 10),  # Top-left corner
-                (peak_x + 10, peak_y + 10)   # Bottom-right corner
-            ],
-            outline="red",  # Circle border color
-            width=4,        # Circle border thickness
-            fill="yellow"   # Fill color of the circle
-        )
+        """Show the time-displacement graph for the speckle."""
+        self.graph_image_view.image = toga.Image(src=self.plots[0])
 
-        # Draw a vertical line from the peak to the X-axis
-        draw.line(
-            (peak_x, peak_y, peak_x, height - bottom_margin),  # From peak to X-axis
-            fill="blue",  # Line color
-            width=2       # Line thickness
-        )
-
-        # Display measured frequency as text near the circle
-        draw.text(
-            (peak_x - 50, peak_y - 40),  # Adjust position to be above the circle
-            f"{measured_freq:.2f} Hz",
-            fill="black",
-            font_size=20
-        )
-
-        # Convert the graph to a format Toga can display
-        img_bytes = io.BytesIO()
-        graph.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
-        self.fft_image_view.image = toga.Image(src=img_bytes.getvalue())
-
-        return measured_freq
+    def visualize_frequency_spectrum(self):
+        """Show the frequency spectrum graph for the speckle and return its main frequency."""
+        self.fft_image_view.image = toga.Image(src=self.plots[1])
+        return self.plots[2]
 
 
 class ImagePickerDelegate(UIViewController):
@@ -251,23 +114,27 @@ class ImagePickerDelegate(UIViewController):
     def imagePickerController_didFinishPickingMediaWithInfo_(self, picker, info):
         image = info.valueForKey_('UIImagePickerControllerOriginalImage')
         if image:
-            data = ObjCInstance(uikit.UIImageJPEGRepresentation(image, 0))
-            buf = ctypes.create_string_buffer(data.length)
-            ctypes.memmove(ctypes.byref(buf), data.bytes, data.length)
-
-            img = Image.open(io.BytesIO(buf))
-            gray_img = img.convert('L')
-
-            self.app.selected_images.append(np.array(gray_img))
-            
-            thumbnail_height = 100
-            aspect_ratio = gray_img.width / gray_img.height
-            thumbnail_width = int(thumbnail_height * aspect_ratio)
-            
-            thumbnail = toga.ImageView(style=Pack(width=thumbnail_width, height=thumbnail_height, padding=(5, 5)))
-            img_bytes = io.BytesIO()
-            gray_img.save(img_bytes, format='PNG')
-            thumbnail.image = toga.Image(src=img_bytes.getvalue())
+            frame = None
+            url = info.valueForKey_('UIImagePickerControllerImageURL')
+            if url is not None:
+                # The picker's exported file (a JPEG by default) is decoded as is, through the luma draft path
+                try:
+                    frame = load_frame(str(url.path), channel=FRAME_CHANNEL)
+                except OSError:
+                    pass
+            if frame is None:
+                # No readable file: fall back to a lossless PNG of the picked image
+                data = ObjCInstance(uikit.UIImagePNGRepresentation(image))
+                buf = ctypes.create_string_buffer(data.length)
+                ctypes.memmove(ctypes.byref(buf), data.bytes, data.length)
+                frame = load_frame(buf.raw, channel=FRAME_CHANNEL)
+
+            index = self.app.selected_images.append(frame)
+
+            # Small thumbnail from a reduced copy instead of encoding the full frame
+            thumbnail_image = self.app.selected_images.thumbnail(index)
+            thumbnail = toga.ImageView(style=Pack(width=thumbnail_image.width, height=thumbnail_image.height, padding=(5, 5)))
+            thumbnail.image = toga.Image(src=self.app.selected_images.thumbnail_png(index))
             self.app.image_scroll_box.add(thumbnail)
 
             self.app.result_label.text = f"{len(self.app.selected_images)} images selected."
@@ -351,8 +218,15 @@ class ImagePickerApp(toga.App):
         self.picker.sourceType = 0
         self.picker.delegate = self.delegate
 
-        self.selected_images = []
+        self.selected_images = FrameStack(max_bytes=FRAME_MEMORY_LIMIT)
         self.speckle_data = []
+        # Spacing of the samples in speckle_data, from the analysis' DisplacementStore
+        self.sample_period = None
+        self.frequency_table = None
+        self.analysis_cancel = None
+        # Rendered detail screens keyed by (analysis id, speckle index, plot size)
+        self.render_cache = RenderCache(RENDER_CACHE_SIZE)
+        self.analysis_id = 0
 
     def pick_image(self, widget):
         if len(self.selected_images) == 0:
@@ -366,49 +240,118 @@ class ImagePickerApp(toga.App):
             self.picker, True, None
         )
     
-    def analyze_vibration(self, widget):
+    async def analyze_vibration(self, widget):
     
         if len(self.selected_images) == 0:
             self.result_label.text = "Please select at least 1 image first."
             return
+        if self.analysis_cancel is not None:
+            # An analysis is already running
+            return
 
         self.result_label.text = "Processing vibration analysis..."
 
-        try:
-            dis_all_speckle, num_speckle, process_time = vib_extraction(self.selected_images)
-            process_time = process_time
-            self.result_label.text = f"Processing Time Per Frame: {process_time:.2f}"
-            if num_speckle > 0 and dis_all_speckle:
-                valid_speckles = dis_all_speckle[:num_speckle]
-                self.speckle_data = valid_speckles
-                self.create_speckle_buttons(valid_speckles, num_speckle)
-            else:
-                self.result_label.text = "No valid speckles found."
+        # The pipeline runs on a worker thread; Clear sets the event to stop it
+        images = self.selected_images[:]
+        # Built here so the partial estimates use the same sample period as the final results
+        plan = VibPlan(images[0].shape)
+        cancel = self.analysis_cancel = threading.Event()
+        loop = asyncio.get_running_loop()
+        # Per-speckle peak frequencies of the frames seen so far, shown on placeholder buttons
+        partial_freqs = {}
+        pending_buttons = {}
+        self.speckle_buttons_box.children.clear()
+
+        def show_progress(frame, frame_freqs):
+            if cancel.is_set():
+                return
+            for speckle_id, freq in sorted(frame_freqs.items()):
+                freqs = partial_freqs.setdefault(speckle_id, [])
+                freqs.append(freq)
+                if speckle_id not in pending_buttons:
+                    pending_buttons[speckle_id] = toga.Button(
+                        "", enabled=False, style=Pack(padding=(5, 5), width=200))
+                    self.speckle_buttons_box.add(pending_buttons[speckle_id])
+                pending_buttons[speckle_id].text = (
+                    f"Speckle {speckle_id + 1} (~{np.median(freqs):.0f} Hz, {len(freqs)} frame(s))")
+            self.result_label.text = f"Processing frame {frame + 1}/{len(images)}: {len(partial_freqs)} speckle(s) found"
+
+        def progress(frame, segments):
+            if cancel.is_set():
+                raise AnalysisCancelled()
+            # A rough per-frame estimate from this frame's band alone; the final table replaces it
+            frame_freqs = {speckle_id: estimate_peak_frequency(dis, 1 / plan.sample_period)
+                           for speckle_id, dis in segments if len(dis) > 2}
+            loop.call_soon_threadsafe(show_progress, frame, frame_freqs)
+
+        def analyze():
+            dis_all_speckle, num_speckle, process_time = vib_extraction(images, plan=plan, progress=progress)
+            return dis_all_speckle, num_speckle, process_time, speckle_frequency_table(dis_all_speckle)
 
+        try:
+            dis_all_speckle, num_speckle, process_time, frequency_table = await loop.run_in_executor(None, analyze)
+        except AnalysisCancelled:
+            return
         except Exception as e:
-            self.result_label.text = f"Error: {str(e)}"
-    def create_speckle_buttons(self, valid_speckles, num_speckle):
-        
-        self.speckle_buttons_box.children.clear()
-        
-       
-        for i in range(num_speckle):
-            if i < len(valid_speckles) and len(valid_speckles[i]) > 0:
-                button = toga.Button(
-                    f"Speckle {i + 1}",
-                    on_press=lambda widget, idx=i: self.navigate_to_speckle(idx),
-                    style=Pack(padding=(5, 5), width=200)
-                )
-                self.speckle_buttons_box.add(button)
-                
+            if not cancel.is_set():
+                self.result_label.text = f"Error: {str(e)}"
+                # Put the previous analysis' buttons back in place of the placeholders
+                self.create_speckle_buttons(self.speckle_data, len(self.speckle_data))
+            return
+        finally:
+            if self.analysis_cancel is cancel:
+                self.analysis_cancel = None
+        if cancel.is_set():
+            return
+
+        self.result_label.text = f"Processing Time Per Frame: {process_time:.2f}"
+        if num_speckle > 0 and dis_all_speckle:
+            valid_speckles = dis_all_speckle[:num_speckle]
+            self.analysis_id += 1
+            # Screens of the previous analysis are never shown again; make room for every new one
+            self.render_cache.clear()
+            self.render_cache.maxsize = max(RENDER_CACHE_SIZE, len(valid_speckles))
+            self.speckle_data = valid_speckles
+            self.sample_period = dis_all_speckle.sample_period
+            self.frequency_table = frequency_table
+            self.create_speckle_buttons(valid_speckles, num_speckle)
+            if PRECOMPUTE_PLOTS:
+                # Render every detail screen in the background so navigation is instant
+                future = loop.run_in_executor(None, self.precompute_plots, self.analysis_id, valid_speckles,
+                                              self.sample_period)
+                future.add_done_callback(self.precompute_done)
+        else:
+            self.result_label.text = "No valid speckles found."
+            self.create_speckle_buttons(self.speckle_data, len(self.speckle_data))
+
+    def speckle_plots(self, analysis_id, speckle_index, speckle_data, sample_period):
+        return self.render_cache.get((analysis_id, speckle_index, PLOT_SIZE),
+                                     lambda: render_speckle(speckle_data, sample_period, size=PLOT_SIZE))
+
+    def precompute_plots(self, analysis_id, speckles, sample_period):
+        for i, speckle_data in enumerate(speckles):
+            # Stop once the results are cleared or replaced by a newer analysis
+            if analysis_id != self.analysis_id:
+                return
+            if len(speckle_data) > 0:
+                self.speckle_plots(analysis_id, i, speckle_data, sample_period)
+
+    def precompute_done(self, future):
+        # A failed background render only costs speed: the screen is rendered again when opened
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Precomputing speckle plots failed", exc_info=future.exception())
+
     def create_speckle_buttons(self, valid_speckles, num_speckle):
 
         self.speckle_buttons_box.children.clear()
         
         for i in range(num_speckle):
             if i < len(valid_speckles) and len(valid_speckles[i]) > 0:
+                label = f"Speckle {i + 1}"
+                if self.frequency_table is not None and i < len(self.frequency_table['peak_freq']):
+                    label += f" ({self.frequency_table['peak_freq'][i]:.1f} Hz)"
                 button = toga.Button(
-                    f"Speckle {i + 1}",
+                    label,
                     on_press=lambda widget, idx=i: self.navigate_to_speckle(idx),  # Bind the current value of i
                     style=Pack(padding=(5, 5), width=200)
                 )
@@ -417,14 +360,26 @@ class ImagePickerApp(toga.App):
     def navigate_to_speckle(self, speckle_index):
 
         if speckle_index < len(self.speckle_data) and len(self.speckle_data[speckle_index]) > 0:
-            speckle_screen = SpeckleDetailScreen(self.speckle_data[speckle_index], speckle_index)
+            speckle_data = self.speckle_data[speckle_index]
+            plots = self.speckle_plots(self.analysis_id, speckle_index, speckle_data, self.sample_period)
+            speckle_screen = SpeckleDetailScreen(speckle_data, speckle_index, self.sample_period, plots)
             self.main_window.content = speckle_screen
 
     def clear_data(self, widget):
         """Reset the app to its initial state by regenerating the UI."""
+        # Stop a running analysis; its results are dropped
+        if self.analysis_cancel is not None:
+            self.analysis_cancel.set()
+            self.analysis_cancel = None
+
         # Clear stored data
         self.selected_images.clear()
         self.speckle_data.clear()
+        self.sample_period = None
+        self.frequency_table = None
+        self.analysis_id += 1
+        self.render_cache.clear()
+        self.render_cache.maxsize = RENDER_CACHE_SIZE
 
         # Reinitialize the main UI layout
         self.main_box = toga.Box(style=Pack(direction=COLUMN))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app package lives in app/ as Briefcase lays it out; import it from there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'app'))
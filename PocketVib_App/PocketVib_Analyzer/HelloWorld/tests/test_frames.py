@@ -0,0 +1,107 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from helloworld.PocketVib_Frames import FrameStack
+
+
+def make_frames(count, shape=(4, 6)):
+    rng = np.random.default_rng(count)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(count)]
+
+
+def test_frames_round_trip_in_memory():
+    frames = make_frames(3)
+    stack = FrameStack()
+    assert [stack.append(frame) for frame in frames] == [0, 1, 2]
+    assert len(stack) == 3 and stack.shape == (4, 6) and stack.nbytes == 3 * 24
+    assert not stack.spilled
+    for stored, frame in zip(stack, frames):
+        np.testing.assert_array_equal(stored, frame)
+    np.testing.assert_array_equal(stack[-1], frames[-1])
+    assert len(stack[1:]) == 2
+    with pytest.raises(IndexError):
+        stack[3]
+
+
+def test_spills_to_memmap_past_max_bytes():
+    frames = make_frames(3)
+    # 24-byte frames: capacities 1 and 2 fit in RAM, growing to 4 does not
+    stack = FrameStack(max_bytes=50)
+    stack.append(frames[0])
+    stack.append(frames[1])
+    assert not stack.spilled
+    stack.append(frames[2])
+    assert stack.spilled
+    assert isinstance(stack._buffer, np.memmap)
+    for stored, frame in zip(stack, frames):
+        np.testing.assert_array_equal(stored, frame)
+
+
+def test_spilled_file_grows_in_place():
+    frames = make_frames(9)
+    stack = FrameStack(max_bytes=50)
+    for frame in frames[:3]:
+        stack.append(frame)
+    spill_file = stack._file.name
+    # Capacity 4 -> 8 -> 16 while spilled
+    for frame in frames[3:]:
+        stack.append(frame)
+    assert stack._file.name == spill_file
+    assert len(stack._buffer) == 16
+    for stored, frame in zip(stack, frames):
+        np.testing.assert_array_equal(stored, frame)
+
+
+def test_roi_keeps_whole_rows():
+    frame = make_frames(1, (5, 8))[0]
+    stack = FrameStack(roi=(2, 6))
+    stack.append(frame)
+    assert stack.shape == (5, 4)
+    np.testing.assert_array_equal(stack[0], frame[:, 2:6])
+
+
+def test_float_frames_are_rounded_and_clipped():
+    stack = FrameStack()
+    stack.append(np.array([[-5.2, 3.6], [254.5, 300.0]]))
+    assert stack[0].dtype == np.uint8
+    np.testing.assert_array_equal(stack[0], [[0, 4], [254, 255]])
+
+
+def test_rejects_bad_frames():
+    stack = FrameStack()
+    with pytest.raises(ValueError):
+        stack.append(np.zeros((2, 3, 3)))
+    stack.append(np.zeros((2, 3)))
+    with pytest.raises(ValueError):
+        stack.append(np.zeros((3, 2)))
+
+
+def test_thumbnails_are_scaled_and_cached():
+    stack = FrameStack(thumbnail_height=50)
+    stack.append(make_frames(1, (200, 300))[0])
+    thumbnail = stack.thumbnail(0)
+    assert thumbnail.size == (75, 50)
+    assert stack.thumbnail(0) is thumbnail
+    assert stack.thumbnail(0, height=20).size == (30, 20)
+    with Image.open(io.BytesIO(stack.thumbnail_png(0))) as png:
+        assert png.format == 'PNG' and png.size == (75, 50)
+
+
+def test_clear_then_append():
+    stack = FrameStack(max_bytes=50)
+    for frame in make_frames(3):
+        stack.append(frame)
+    stack.thumbnail(0)
+    spill_file = stack._file
+    stack.clear()
+    assert len(stack) == 0 and stack.shape is None and stack.nbytes == 0
+    assert not stack.spilled and spill_file.closed
+    assert stack._thumbnails == {}
+    # A cleared stack takes frames of any shape again, starting in RAM
+    frame = make_frames(1, (2, 2))[0]
+    assert stack.append(frame) == 0
+    assert not stack.spilled
+    np.testing.assert_array_equal(stack[0], frame)
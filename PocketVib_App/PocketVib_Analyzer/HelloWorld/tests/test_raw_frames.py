@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+
+from helloworld.PocketVib_Frames import open_nv12, open_y4m
+
+
+def write_nv12(path, planes, stride):
+    height, width = planes[0].shape
+    with open(path, 'wb') as f:
+        for y in planes:
+            padded = np.full((height + (height + 1) // 2, stride), 128, dtype=np.uint8)
+            padded[:height, :width] = y
+            f.write(padded.tobytes())
+
+
+def write_y4m(path, planes, header=b'YUV4MPEG2 W{w} H{h} F30:1 C420jpeg', frame_line=b'FRAME'):
+    height, width = planes[0].shape
+    chroma = 2 * ((width + 1) // 2) * ((height + 1) // 2)
+    with open(path, 'wb') as f:
+        f.write(header.replace(b'{w}', str(width).encode()).replace(b'{h}', str(height).encode()) + b'\n')
+        for y in planes:
+            f.write(frame_line + b'\n' + y.tobytes() + bytes([128]) * chroma)
+
+
+def make_planes(count, shape=(5, 6)):
+    rng = np.random.default_rng(count)
+    return [rng.integers(0, 256, shape, dtype=np.uint8) for _ in range(count)]
+
+
+def test_nv12_with_padded_stride(tmp_path):
+    planes = make_planes(3)
+    write_nv12(tmp_path / 'cap.nv12', planes, stride=8)
+    frames = open_nv12(tmp_path / 'cap.nv12', width=6, height=5, stride=8)
+    assert len(frames) == 3 and frames.shape == (5, 6)
+    for frame, plane in zip(frames, planes):
+        np.testing.assert_array_equal(frame, plane)
+    np.testing.assert_array_equal(frames[-1], planes[-1])
+
+
+def test_nv12_views_are_zero_copy_and_read_only(tmp_path):
+    write_nv12(tmp_path / 'cap.nv12', make_planes(2), stride=8)
+    frames = open_nv12(tmp_path / 'cap.nv12', width=6, height=5, stride=8)
+    frame = frames[1]
+    assert np.shares_memory(frame, frames._data)
+    assert not frame.flags.writeable
+    with pytest.raises(ValueError):
+        frame[0, 0] = 0
+
+
+def test_nv12_rejects_partial_frames(tmp_path):
+    write_nv12(tmp_path / 'cap.nv12', make_planes(2), stride=6)
+    with open(tmp_path / 'cap.nv12', 'ab') as f:
+        f.write(b'\0' * 7)
+    with pytest.raises(ValueError):
+        open_nv12(tmp_path / 'cap.nv12', width=6, height=5)
+    with pytest.raises(ValueError):
+        open_nv12(tmp_path / 'cap.nv12', width=6, height=5, stride=4)
+
+
+def test_y4m_with_frame_parameters(tmp_path):
+    planes = make_planes(3)
+    write_y4m(tmp_path / 'cap.y4m', planes, frame_line=b'FRAME Ixyz')
+    frames = open_y4m(tmp_path / 'cap.y4m')
+    assert len(frames) == 3 and frames.shape == (5, 6) and frames.fps == 30
+    for frame, plane in zip(frames, planes):
+        np.testing.assert_array_equal(frame, plane)
+        assert np.shares_memory(frame, frames._data)
+        assert not frame.flags.writeable
+
+
+@pytest.mark.parametrize('colour', [b'mono', b'444', b'422'])
+def test_y4m_colour_spaces(tmp_path, colour):
+    plane = make_planes(1)[0]
+    chroma = {b'mono': 0, b'444': 2 * 30, b'422': 2 * 3 * 5}[colour]
+    with open(tmp_path / 'cap.y4m', 'wb') as f:
+        f.write(b'YUV4MPEG2 W6 H5 C' + colour + b'\nFRAME\n' + plane.tobytes() + b'\0' * chroma)
+    np.testing.assert_array_equal(open_y4m(tmp_path / 'cap.y4m')[0], plane)
+
+
+@pytest.mark.parametrize('colour', [b'420p10', b'444p16'])
+def test_y4m_rejects_high_bit_depth(tmp_path, colour):
+    write_y4m(tmp_path / 'cap.y4m', make_planes(1), header=b'YUV4MPEG2 W{w} H{h} C' + colour)
+    with pytest.raises(ValueError, match='colour space'):
+        open_y4m(tmp_path / 'cap.y4m')
+
+
+def test_y4m_rejects_truncated_frames(tmp_path):
+    write_y4m(tmp_path / 'cap.y4m', make_planes(2))
+    with open(tmp_path / 'cap.y4m', 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 1)
+    with pytest.raises(ValueError, match='ends inside a frame'):
+        open_y4m(tmp_path / 'cap.y4m')
+
+
+def test_y4m_rejects_bad_frame_headers(tmp_path):
+    write_y4m(tmp_path / 'cap.y4m', make_planes(2), frame_line=b'FRAMX')
+    with pytest.raises(ValueError, match='Bad frame header'):
+        open_y4m(tmp_path / 'cap.y4m')
+
+
+@pytest.mark.parametrize('content, message', [
+    (b'\nYUV4MPEG2 W6 H5\n', 'not a YUV4MPEG2 file'),
+    (b'   \nFRAME\n', 'not a YUV4MPEG2 file'),
+    (b'RIFF W6 H5\n', 'not a YUV4MPEG2 file'),
+    (b'YUV4MPEG2 W6 H5', 'not a YUV4MPEG2 file'),
+    (b'YUV4MPEG2 H5\n', 'bad YUV4MPEG2 header'),
+    (b'YUV4MPEG2 W6\n', 'bad YUV4MPEG2 header'),
+    (b'YUV4MPEG2 W6x H5\n', 'bad YUV4MPEG2 header'),
+    (b'YUV4MPEG2 W0 H5\n', 'bad YUV4MPEG2 header'),
+    (b'YUV4MPEG2 W6 H5 F30\n', 'bad YUV4MPEG2 header'),
+    (b'YUV4MPEG2 W6 H5 F30:0\n', 'bad YUV4MPEG2 header'),
+])
+def test_y4m_rejects_bad_file_headers(tmp_path, content, message):
+    (tmp_path / 'cap.y4m').write_bytes(content)
+    with pytest.raises(ValueError, match=message):
+        open_y4m(tmp_path / 'cap.y4m')
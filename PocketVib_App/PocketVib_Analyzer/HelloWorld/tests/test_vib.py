@@ -0,0 +1,191 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from helloworld.PocketVib_Vib import (
+    LINE_TIME,
+    DisplacementStore,
+    _file_location,
+    _yule_walker_ar,
+    decimate_rows,
+    decimation_factor,
+    decimation_filter,
+    detect_peaks_with_width,
+    estimate_peak_frequency,
+    find_intervals,
+    find_shift_subpixel,
+    gap_aware_peak_frequency,
+    median_filter,
+    vib_extraction,
+)
+
+SAMPLE_DATA = os.path.join(os.path.dirname(__file__), *[os.pardir] * 4, 'sample_data')
+
+
+# The notebook's loops, kept as references for the vectorized replacements
+
+def reference_find_intervals(mask, flag):
+    shortest = 60 if flag == 0 else 100
+    intervals = []
+    start = None
+    for i, value in enumerate(mask):
+        if value and start is None:
+            start = i
+        elif not value and start is not None:
+            if (i - 1) - start > shortest:
+                intervals.append((start, i - 1))
+            start = None
+    if start is not None and (len(mask) - 1) - start > shortest:
+        intervals.append((start, len(mask) - 1))
+    return intervals
+
+
+def reference_find_shift_subpixel(image):
+    dis = [0]
+    image = (image - np.mean(image, axis=1, keepdims=True)) / (np.std(image, axis=1, keepdims=True) + 1e-6)
+    for row in range(image.shape[0] - 1):
+        correlation = np.correlate(image[row], image[row + 1], mode='full')
+        max_index = np.argmax(correlation)
+        shift = max_index - (image.shape[1] - 1)
+        if 1 <= max_index <= len(correlation) - 2:
+            R_m1, R_0, R_p1 = correlation[max_index - 1:max_index + 2]
+            denominator = R_m1 - 2 * R_0 + R_p1
+            if denominator != 0:
+                shift += 0.5 * (R_m1 - R_p1) / denominator
+        dis.append(shift)
+    return np.array(dis)
+
+
+def reference_detect_peaks_with_width(signal, height_threshold, min_distance):
+    signal = np.array(signal)
+    baseline = np.median(signal)
+    threshold = baseline + height_threshold * (np.max(signal) - baseline)
+    peaks = [i for i in range(1, len(signal) - 1)
+             if signal[i] > signal[i - 1] and signal[i] > signal[i + 1] and signal[i] >= threshold]
+    if len(peaks) > 1:
+        filtered_peaks = [peaks[0]]
+        for p in peaks[1:]:
+            if p - filtered_peaks[-1] >= min_distance:
+                filtered_peaks.append(p)
+        peaks = filtered_peaks
+    intervals = []
+    for i, peak in enumerate(peaks):
+        left = right = peak
+        half_height = baseline + (signal[peak] - baseline) / 2
+        left_limit = (peaks[i - 1] + peak) // 2 if i > 0 else 0
+        right_limit = (peak + peaks[i + 1]) // 2 if i < len(peaks) - 1 else len(signal) - 1
+        while left > left_limit and signal[left - 1] > half_height:
+            left -= 1
+        while right < right_limit and signal[right + 1] > half_height:
+            right += 1
+        intervals.append((left, right))
+    return intervals
+
+
+# fast_fft_length(2 * n) is odd for each of these (15, 125, 225, 1215)
+@pytest.mark.parametrize('n', [7, 61, 110, 604])
+def test_yule_walker_matches_direct_autocorrelation(n):
+    x = np.random.default_rng(n).standard_normal(n)
+    order = 5
+    r = np.array([np.dot(x[:n - k], x[k:]) / n for k in range(order + 1)])
+    toeplitz = r[np.abs(np.subtract.outer(np.arange(order), np.arange(order)))]
+    expected = np.linalg.solve(toeplitz, r[1:])
+    np.testing.assert_allclose(_yule_walker_ar(x, order), expected, rtol=1e-9, atol=1e-12)
+
+
+
+def test_gap_aware_peak_matches_stitched_estimate():
+    rng = np.random.default_rng(0)
+    store = DisplacementStore(1079, 1844, n_frames=40)
+    t = np.arange(1079) * LINE_TIME
+    for frame in range(40):
+        start = frame * (1079 + 1844) * LINE_TIME
+        store.set(0, frame, np.sin(2 * np.pi * 637.6 * (start + t)) + 0.3 * rng.standard_normal(1079))
+        # The second speckle is only seen in some frames, which breaks the frame-rate comb
+        if frame % 4 in (0, 3):
+            store.set(1, frame, 0.5 * np.sin(2 * np.pi * 303.2 * (start + t) + 1) + 0.3 * rng.standard_normal(1079))
+    stitched = np.stack([np.asarray(signal) for signal in store[:]])
+    expected = estimate_peak_frequency(stitched, 1 / LINE_TIME)
+    np.testing.assert_allclose(gap_aware_peak_frequency(store), expected, rtol=0, atol=1e-6)
+    np.testing.assert_allclose(expected, [637.6, 303.2], atol=0.05)
+
+
+def test_parallel_frames_from_memory_and_from_a_file(tmp_path):
+    frames = [np.array(Image.open(path).convert('L'))
+              for path in sorted(glob.glob(os.path.join(SAMPLE_DATA, 'frame_*.jpg')))[:6]]
+    path = tmp_path / 'frames.u8'
+    np.stack(frames).tofile(path)
+    mapped = np.memmap(path, dtype=np.uint8, mode='r', shape=(len(frames),) + frames[0].shape)
+    assert _file_location(mapped[3])[:2] == (str(path), 3 * frames[0].nbytes)
+    assert _file_location(frames[0]) is None
+
+    expected = vib_extraction(frames)[0].data
+    # Two workers share four slots, so the ring is reused for six in-memory frames
+    np.testing.assert_array_equal(vib_extraction(frames, workers=2)[0].data, expected)
+    np.testing.assert_array_equal(vib_extraction(list(mapped), workers=2)[0].data, expected)
+
+
+def test_decimation_filter_rejects_everything_that_aliases_into_the_band():
+    cutoff, fs = 2000, 1 / LINE_TIME
+    k = decimation_factor(cutoff)
+    taps = decimation_filter(k)
+    freqs = np.linspace(0, fs / 2, 20001)
+    response = np.abs(np.exp(-2j * np.pi * np.outer(freqs / fs, np.arange(len(taps)))) @ taps)
+    folded = np.abs((freqs + fs / k / 2) % (fs / k) - fs / k / 2)
+    assert np.all(np.abs(20 * np.log10(response[freqs <= cutoff])) < 0.1)
+    assert 20 * np.log10(response[(freqs > fs / k / 2) & (folded <= cutoff)].max()) < -50
+
+
+def test_decimate_rows_keeps_block_centres():
+    image = np.outer(np.arange(40.0), np.ones(3))
+    # Away from the mirrored edges a ramp comes out at each block's centre row
+    np.testing.assert_allclose(decimate_rows(image, 4)[3:-3, 0], np.arange(3, 7) * 4 + 1.5)
+    assert decimate_rows(image[:39], 4).shape == (9, 3)
+    assert decimate_rows(image, 1) is image
+
+
+def test_median_filter_matches_pil():
+    rng = np.random.default_rng(4)
+    # Odd and even sizes, and bands of different heights sharing one canvas
+    bands = [rng.integers(0, 256, shape, dtype=np.uint8) for shape in ((9, 7), (12, 10), (31, 4), (3, 16))]
+    expected = [np.array(Image.fromarray(band).filter(ImageFilter.MedianFilter(size=7))) for band in bands]
+    for band, filtered, reference in zip(bands, median_filter(bands), expected):
+        assert filtered.shape == band.shape
+        np.testing.assert_array_equal(filtered, reference)
+    np.testing.assert_array_equal(median_filter(bands[1]), expected[1])
+
+
+@pytest.mark.parametrize('shape', [(12, 40), (7, 33)])
+def test_find_shift_subpixel_matches_np_correlate(shape):
+    rng = np.random.default_rng(shape[1])
+    row = rng.standard_normal(shape[1] + 2 * shape[0])
+    # Each row is the previous one shifted by about a pixel, plus noise
+    image = np.stack([row[i:i + shape[1]] for i in range(shape[0])]) + 0.1 * rng.standard_normal(shape)
+    np.testing.assert_allclose(find_shift_subpixel(image), reference_find_shift_subpixel(image), rtol=1e-9, atol=1e-9)
+
+
+def test_detect_peaks_with_width_matches_loop():
+    rng = np.random.default_rng(6)
+    x = np.arange(600)
+    signals = [sum(h * np.exp(-(x - c)**2 / (2 * w**2)) for c, h, w in zip(*params)) + 0.02 * rng.standard_normal(600)
+               for params in (((100, 250, 480), (1, 0.6, 0.9), (20, 15, 30)),
+                              ((90, 150, 400), (0.8, 1, 0.3), (10, 10, 40)))]
+    for signal in signals:
+        expected = reference_detect_peaks_with_width(signal, 0.1, 100)
+        assert [tuple(interval) for interval in detect_peaks_with_width(signal, 0.1, 100)] == expected
+    batched = detect_peaks_with_width(np.stack(signals), 0.1, 100)
+    assert [[tuple(interval) for interval in row] for row in batched] == [
+        reference_detect_peaks_with_width(signal, 0.1, 100) for signal in signals]
+
+
+@pytest.mark.parametrize('flag', [0, 1])
+def test_find_intervals_matches_loop(flag):
+    rng = np.random.default_rng(flag)
+    # Runs around both thresholds, including ones touching either end of the mask
+    lengths = [61, 62, 63, 100, 101, 102, 103, 5, 150]
+    mask = np.concatenate([np.r_[np.ones(n, bool), np.zeros(rng.integers(1, 5), bool)] for n in lengths] + [np.ones(120, bool)])
+    for m in (mask, np.r_[np.ones(101, bool), mask]):
+        assert find_intervals(m, flag) == reference_find_intervals(m, flag)